@@ -0,0 +1,2829 @@
+"""
+everything dumpifs does, as a module: the dumpifs.py script only launches main(), so that what runs on every
+invocation is this module loaded from its cached .pyc rather than compiled again
+"""
+import time
+IMPORT_START = time.perf_counter()
+from pathlib import Path
+import os
+import sys
+import re
+import threading
+from ctypes import sizeof, create_string_buffer, c_uint32, byref, c_ushort, c_uint, string_at, addressof, POINTER, \
+    BigEndianStructure, Array, CDLL, c_char, c_int, memmove, c_long, c_size_t, c_void_p
+from struct import Struct, unpack_from
+import errno
+import io
+import mmap
+import shutil
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import ExitStack, redirect_stdout
+from fnmatch import fnmatchcase
+import posixpath
+from typing import BinaryIO, TextIO, Union, Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Sequence, \
+    Tuple
+
+from ifs_header import struct_startup_header, struct_image_header, struct_image_trailer, \
+    STARTUP_HDR_FLAGS1_COMPRESS_MASK, \
+    STARTUP_HDR_FLAGS1_COMPRESS_UCL, struct_image_attr, IMAGE_FLAGS_BIGENDIAN, STARTUP_HDR_FLAGS1_BIGENDIAN, \
+    STARTUP_HDR_FLAGS1_COMPRESS_ZLIB, STARTUP_HDR_FLAGS1_COMPRESS_LZO, STARTUP_HDR_FLAGS1_COMPRESS_NONE
+from utils import rmtree_writable, shutil_rm
+
+logger = logging.getLogger(__name__)
+
+S_IFMT = 0o0170000
+S_IFDIR = 0o0040000  # Directory
+S_IFCHR = 0o0020000  # Character device
+S_IFBLK = 0o0060000  # Block device
+S_IFREG = 0o0100000  # Regular file
+S_IFIFO = 0o0010000  # FIFO
+S_IFLNK = 0o0120000  # Symbolic link
+S_IFSOCK = 0o0140000  # Socket
+g_verbose = False
+
+
+def big_endian_variant(struct_type: type) -> type:
+    """
+    BigEndianStructure with the fields of the little endian `struct_type` of ifs_header
+    """
+    return type(f'{struct_type.__name__}_be', (BigEndianStructure,), {'_fields_': struct_type._fields_})
+
+
+struct_startup_header_be = big_endian_variant(struct_startup_header)
+struct_image_header_be = big_endian_variant(struct_image_header)
+# struct_image_attr then the head of the dirent tail, offset and size of a file, dev and rdev of a device,
+# sym_offset and sym_size of a symlink
+DIRENT_CODECS = {
+    endian: (Struct(f'{endian}2H5I'), Struct(f'{endian}2I'), Struct(f'{endian}2H'))
+    for endian in '<>'
+}
+
+
+DEFAULT_SPILL_THRESHOLD = 1024 * 1024 * 1024
+BLOCK_SIZE = 0x10000
+MAX_SYMLINKS = 40
+startup_header_pattern = b'\xEB\x7E\xFF\x00.{46}\x00{14}'
+image_header_pattern = b'imagefs[\x00-\x07]'
+header_signatures = (
+    ('startup', b'\xEB\x7E\xFF\x00', re.compile(startup_header_pattern, re.DOTALL)),
+    ('imagefs', b'imagefs', re.compile(image_header_pattern)),
+)
+SCAN_WINDOW = 4 * 1024 * 1024
+MANIFEST_NAME = '.dumpifs-manifest.json'
+# compressed bytes fed to zlib at a time, DUMPIFS_ZLIB_CHUNK_KB overrides it, and the most it inflates per call
+# relative to them, which bounds the bytes objects it allocates on highly compressible images. The input zlib leaves
+# over is copied on every call, so the output bound grows with the chunk: inflating 61 MB out of 18 MB took 0.165 s
+# with 1 MiB chunks, as with 64 KiB ones, but 0.28 s with 4 MiB chunks inflated 256 KiB at a time.
+ZLIB_CHUNK_SIZE = 1024 * 1024
+ZLIB_OUTPUT_RATIO = 4
+# decompressor library -> environment variable with an explicit path of it, overriding find_library()
+DECOMPRESSOR_LIBRARIES = {
+    'lzo2': 'DUMPIFS_LIBLZO2',
+    'ucl': 'DUMPIFS_LIBUCL',
+}
+# from the start of the process up to main(), measured at 128-165 ms on a single cpu host where the interpreter alone
+# takes 75-100 ms, and at 235-245 ms when this module is compiled rather than loaded from its .pyc. A batch of
+# thousands of short runs pays it on every image.
+STARTUP_BUDGET_MS = 200
+WRITE_BUDGET = 256 * 1024 * 1024
+# bytes an IFSImage decompresses a zlib image ahead of what is read from it
+STREAM_READAHEAD = 1024 * 1024
+ARCHIVE_FORMATS = ('tar', 'cpio')
+COMPRESSION_NAMES = {
+    STARTUP_HDR_FLAGS1_COMPRESS_NONE: 'none',
+    STARTUP_HDR_FLAGS1_COMPRESS_ZLIB: 'zlib',
+    STARTUP_HDR_FLAGS1_COMPRESS_LZO: 'lzo',
+    STARTUP_HDR_FLAGS1_COMPRESS_UCL: 'ucl',
+}
+
+
+def main() -> int:
+    import argparse
+    res = check_startup_budget()
+    if res != 0:
+        return res
+    if sys.argv[1:2] == ['cat']:
+        return main_cat(sys.argv[2:])
+    if sys.argv[1:2] == ['batch']:
+        return main_batch(sys.argv[2:])
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('ifs_filename')
+    argparser.add_argument('-d', '--outputdir')
+    argparser.add_argument('-v', '--verbose', action='store_true')
+    add_image_arguments(argparser)
+    argparser.add_argument('--only', action='append', metavar='GLOB',
+                           help='extract only the entries matching GLOB (or under a directory matching it)')
+    argparser.add_argument('--exclude', action='append', metavar='GLOB',
+                           help='do not extract the entries matching GLOB (or under a directory matching it)')
+    argparser.add_argument('--all', action='store_true',
+                           help='extract every image found in the input, e.g. a whole flash dump, each into its own '
+                                'subdirectory')
+    argparser.add_argument('--workers', type=int, default=os.cpu_count(),
+                           help='processes extracting the images of --all in parallel')
+    add_output_arguments(argparser)
+    argparser.add_argument('--format', choices=('dir',) + ARCHIVE_FORMATS, default='dir',
+                           help='extract into OUTPUTDIR (default), or stream a tar or cpio archive of the image with '
+                                'its modes, owners and device nodes to --output')
+    argparser.add_argument('-o', '--output', default='-', metavar='ARCHIVE',
+                           help='archive of --format tar|cpio, - for stdout (default)')
+    argparser.add_argument('--list', action='store_true',
+                           help='only print the listing of the image and the stats of its entries, decompressing no '
+                                'more of it than its directory, and without extracting anything')
+    argparser.add_argument('--pipeline', action='store_true',
+                           help='extract the files of a compressed image while the rest of it is still being '
+                                'decompressed, rather than once all of it is')
+    args = argparser.parse_args()
+    export_image_arguments(args)
+    ifs_filepath = Path(args.ifs_filename).expanduser().resolve()
+    global g_verbose
+    g_verbose = args.verbose
+
+    if not ifs_filepath.is_file():
+        logger.error(f'{ifs_filepath=} is not a file')
+        return errno.ENOENT
+    if args.list:
+        if args.all or args.format != 'dir':
+            argparser.error('--list lists a single image, not --all nor --format tar|cpio')
+        return list_image(ifs_filepath, args.spill_threshold * 1024 * 1024, args.jobs,
+                          index_path_arg(args, ifs_filepath), path_selector(args.only, args.exclude))
+    if args.format != 'dir':
+        if args.all:
+            argparser.error('--format tar|cpio archives a single image, not --all')
+        archive_args = (ifs_filepath, args.format, args.spill_threshold * 1024 * 1024, args.jobs,
+                        index_path_arg(args, ifs_filepath), path_selector(args.only, args.exclude))
+        if args.output != '-':
+            try:
+                out = open(args.output, 'wb')
+            except OSError as ex:
+                logger.error(f'unable to write the archive: {ex}')
+                return ex.errno or errno.EIO
+            with out:
+                res = archive(out, *archive_args)
+            if res != 0:
+                # a partial archive would pass for the whole image
+                Path(args.output).unlink(missing_ok=True)
+            return res
+        # stdout carries the archive, the listing and the logs go to stderr
+        log_to_stderr()
+        out = sys.stdout.buffer
+        with redirect_stdout(sys.stderr):
+            return archive(out, *archive_args)
+    if args.outputdir is None:
+        argparser.error('the following arguments are required: -d/--outputdir')
+    if args.all and args.index is not None:
+        # the index of a file is the block table of its first image
+        argparser.error('--index is the block index of a single image, not of --all')
+    outputdir = Path(args.outputdir).expanduser().resolve()
+
+    if not args.incremental:
+        try:
+            rmtree_writable(outputdir)
+        except OSError as ex:
+            logger.error(f'unable to empty {outputdir}: {ex}')
+            return ex.errno or errno.EIO
+    outputdir.mkdir(parents=True, exist_ok=True)
+
+    store_root = Path(args.store).expanduser().resolve() if args.store else None
+    if args.all:
+        return process_all(ifs_filepath, outputdir, args.spill_threshold * 1024 * 1024, args.jobs, args.workers,
+                           store_root, args.incremental, args.writers, args.only, args.exclude, args.pipeline)
+    return process(ifs_filepath, outputdir, args.spill_threshold * 1024 * 1024, args.jobs,
+                   index_path_arg(args, ifs_filepath), path_selector(args.only, args.exclude),
+                   BlobStore(store_root) if store_root else None, args.incremental, args.writers, args.pipeline)
+
+
+def check_startup_budget() -> int:
+    """
+    when $DUMPIFS_STARTUP_BUDGET_MS is set, log the time from the start of the process up to main() and enforce the
+    budget, STARTUP_BUDGET_MS for an empty or invalid value
+    :return: ETIME when the startup is over the budget, the run then stops right away so that a CI job fails
+    """
+    budget = os.environ.get('DUMPIFS_STARTUP_BUDGET_MS')
+    if budget is None:
+        return 0
+    elapsed_ms = startup_elapsed_ms()
+    try:
+        budget_ms = float(budget or STARTUP_BUDGET_MS)
+    except ValueError:
+        logger.warning(f'DUMPIFS_STARTUP_BUDGET_MS={budget!r} is not a number of ms, using {STARTUP_BUDGET_MS} ms')
+        budget_ms = STARTUP_BUDGET_MS
+    if elapsed_ms > budget_ms:
+        logger.error(f'startup took {elapsed_ms:.1f} ms, over the budget of {budget_ms:g} ms')
+        return errno.ETIME
+    logger.info(f'startup took {elapsed_ms:.1f} ms')
+    return 0
+
+
+def startup_elapsed_ms() -> float:
+    """
+    ms since the process started, after its starttime in /proc/self/stat, so the start of the interpreter and the
+    compilation of the script are included. Without /proc, only the ms since the import of this module.
+    """
+    try:
+        with open('/proc/self/stat', 'rb') as fin:
+            stat = fin.read()
+        # the fields following the command name, which is in parentheses and may hold spaces, from the state on
+        starttime = int(stat[stat.rindex(b')') + 2:].split()[19])
+        return (time.clock_gettime(time.CLOCK_BOOTTIME) - starttime / os.sysconf('SC_CLK_TCK')) * 1000
+    except (OSError, ValueError, IndexError, AttributeError):
+        return (time.perf_counter() - IMPORT_START) * 1000
+
+
+def add_image_arguments(argparser, index_path: bool = True):
+    argparser.add_argument('--spill-threshold', type=int, default=DEFAULT_SPILL_THRESHOLD // (1024 * 1024),
+                           help='MiB of decompressed image kept in memory before it spills to a temp file')
+    argparser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                           help='threads decompressing UCL/LZO blocks in parallel')
+    if index_path:
+        argparser.add_argument('--index', nargs='?', const='', metavar='PATH',
+                               help='load the block index of a UCL/LZO image from PATH '
+                                    '(default: IFS_FILENAME.idx.json), or write it there after decompressing')
+    else:
+        argparser.add_argument('--index', action='store_const', const='',
+                               help='load the block index of a UCL/LZO image from IFS_FILENAME.idx.json, or write it '
+                                    'there after decompressing')
+    argparser.add_argument('--zlib-chunk', type=int, metavar='KiB',
+                           help=f'compressed KiB of a zlib image inflated at a time (default: '
+                                f'{ZLIB_CHUNK_SIZE // 1024}), like the DUMPIFS_ZLIB_CHUNK_KB environment variable')
+    argparser.add_argument('--library', action='append', metavar='NAME=PATH', type=library_path, default=[],
+                           help=f'load the decompressor library NAME ({", ".join(DECOMPRESSOR_LIBRARIES)}) from PATH '
+                                f'rather than looking it up, like the {", ".join(DECOMPRESSOR_LIBRARIES.values())} '
+                                f'environment variables')
+
+
+def library_path(arg: str) -> Tuple[str, str]:
+    import argparse
+    name, sep, path = arg.partition('=')
+    if not sep or name not in DECOMPRESSOR_LIBRARIES:
+        raise argparse.ArgumentTypeError(
+            f'{arg!r} is not NAME=PATH with NAME one of {", ".join(DECOMPRESSOR_LIBRARIES)}')
+    return name, path
+
+
+def export_image_arguments(args):
+    """
+    export the --library paths and --zlib-chunk to the environment, where the worker processes of a batch find them
+    as well
+    """
+    set_library_paths(args.library)
+    if args.zlib_chunk is not None:
+        os.environ['DUMPIFS_ZLIB_CHUNK_KB'] = str(args.zlib_chunk)
+
+
+def set_library_paths(libraries: List[Tuple[str, str]]):
+    """
+    export the --library paths to the environment, where the worker processes of a batch find them as well
+    """
+    for name, path in libraries:
+        os.environ[DECOMPRESSOR_LIBRARIES[name]] = path
+
+
+def add_output_arguments(argparser):
+    argparser.add_argument('--store', metavar='DIR',
+                           help='keep file bodies in the content addressed store DIR and hardlink the extracted files '
+                                'to it, identical files of many images then take the disk of one')
+    argparser.add_argument('--incremental', action='store_true',
+                           help=f'keep the output directory of a previous run and, after its {MANIFEST_NAME}, only '
+                                f'rewrite the files that changed and remove the entries that disappeared')
+    argparser.add_argument('--writers', type=int, default=min(32, (os.cpu_count() or 1) + 4),
+                           help='threads creating and writing the extracted files of an image in parallel')
+
+
+def index_path_arg(args, ifs_filepath: Path) -> Union[Path, None]:
+    if args.index is None:
+        return None
+    return Path(args.index).expanduser().resolve() if args.index else default_index_path(ifs_filepath)
+
+
+def main_cat(argv: List[str]) -> int:
+    import argparse
+    argparser = argparse.ArgumentParser(prog='dumpifs.py cat', description='write one file of the image to stdout')
+    argparser.add_argument('ifs_filename')
+    argparser.add_argument('path')
+    add_image_arguments(argparser)
+    args = argparser.parse_args(argv)
+    export_image_arguments(args)
+    ifs_filepath = Path(args.ifs_filename).expanduser().resolve()
+    if not ifs_filepath.is_file():
+        logger.error(f'{ifs_filepath=} is not a file')
+        return errno.ENOENT
+    # stdout carries the file, the listing and the logs go to stderr
+    log_to_stderr()
+    out = sys.stdout.buffer
+    with redirect_stdout(sys.stderr):
+        return cat(ifs_filepath, args.path, out, args.spill_threshold * 1024 * 1024, args.jobs,
+                   index_path_arg(args, ifs_filepath))
+
+
+def main_batch(argv: List[str]) -> int:
+    import argparse
+    argparser = argparse.ArgumentParser(prog='dumpifs.py batch',
+                                        description='extract many IFS files on a pool of processes and report each '
+                                                    'of them as a json line')
+    argparser.add_argument('inputs', nargs='*', help='IFS files, or directories searched recursively for files')
+    argparser.add_argument('--files-from', metavar='FILE', help='read one IFS file per line from FILE, - for stdin')
+    argparser.add_argument('-d', '--outputdir', required=True)
+    argparser.add_argument('-o', '--report', default='-', help='json lines report, - for stdout (default)')
+    argparser.add_argument('--workers', type=int, default=os.cpu_count(),
+                           help='processes extracting images in parallel')
+    add_image_arguments(argparser, index_path=False)
+    add_output_arguments(argparser)
+    args = argparser.parse_args(argv)
+    export_image_arguments(args)
+    outputdir = Path(args.outputdir).expanduser().resolve()
+    log_to_stderr()
+
+    jobs = []
+    names = set()
+    inputs = list(args.inputs)
+    if args.files_from:
+        with (sys.stdin if args.files_from == '-' else open(args.files_from)) as fin:
+            inputs += [line.strip() for line in fin if line.strip()]
+    for name in inputs:
+        path = Path(name).expanduser().resolve()
+        if path.is_dir():
+            ifs_files = [(_, _.relative_to(path)) for _ in sorted(path.rglob('*')) if _.is_file()]
+        else:
+            ifs_files = [(path, Path(path.name))]
+        for ifs_file, relpath in ifs_files:
+            out_name = str(relpath)
+            while out_name in names:
+                out_name += '_'
+            names.add(out_name)
+            jobs.append((ifs_file, outputdir / out_name))
+    if not jobs:
+        argparser.error('no IFS file to extract')
+
+    report = sys.stdout if args.report == '-' else open(args.report, 'w')
+    try:
+        return process_batch(jobs, report, args.spill_threshold * 1024 * 1024, args.jobs, args.workers,
+                             args.index is not None, Path(args.store).expanduser().resolve() if args.store else None,
+                             args.incremental, args.writers)
+    finally:
+        if report is not sys.stdout:
+            report.close()
+
+
+def log_to_stderr():
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+            handler.setStream(sys.stderr)
+
+
+def path_selector(only: Union[List[str], None], exclude: Union[List[str], None]) \
+        -> Union[Callable[[str], bool], None]:
+    """
+    :return: predicate telling whether a dirent path is selected by the globs, None to select everything
+    """
+    if not only and not exclude:
+        return None
+    only = [_.strip('/') for _ in only or []]
+    exclude = [_.strip('/') for _ in exclude or []]
+
+    def matches(path: str, patterns: List[str]) -> bool:
+        # a directory matching a pattern brings everything under it along
+        while True:
+            if any(fnmatchcase(path, _) for _ in patterns):
+                return True
+            if '/' not in path:
+                return False
+            path = path.rsplit('/', 1)[0]
+
+    def selected(path: str) -> bool:
+        return (not only or matches(path, only)) and not matches(path, exclude)
+
+    return selected
+
+
+def process(ifs_file: Path, outputdir: Path, spill_threshold: int = DEFAULT_SPILL_THRESHOLD, jobs: int = 1,
+            index_path: Union[Path, None] = None, selector: Union[Callable[[str], bool], None] = None,
+            store: Union['BlobStore', None] = None, incremental: bool = False, writers: int = 1,
+            pipeline: bool = False) -> int:
+    """
+    :param index_path: sidecar BlockIndex of a UCL/LZO image, loaded when it matches `ifs_file`, otherwise written
+           after decompressing
+    :param selector: extract only the dirent paths it selects, a UCL/LZO image is then only decompressed as far as
+           the selected files need
+    :param store: hardlink the extracted files to their blobs in it
+    :param incremental: update `outputdir` after its Manifest instead of extracting into an empty one
+    :param writers: threads writing the extracted files
+    :param pipeline: extract the files of a compressed image as soon as they are decompressed, see StreamingImage
+    """
+    with ExitStack() as stack:
+        res, image, shdr, spos, ipos = load_image(stack, ifs_file, spill_threshold, jobs, index_path,
+                                                  lazy=selector is not None, pipeline=pipeline)
+        if res != 0:
+            return res
+        try:
+            manifest = Manifest.load(outputdir) if incremental else None
+            res = process_image(image, outputdir, shdr, spos, None, ipos, selector, store=store, manifest=manifest,
+                                writers=writers)
+            if res == 0 and isinstance(image, StreamingImage):
+                # the end of the image may still fail to decompress
+                res = image.result()
+            if manifest is not None:
+                res = manifest.finish(res == 0) or res
+            return res
+        except OSError as ex:
+            logger.warning(f'{ex=} while extracting {ifs_file}')
+            return ex.errno or errno.EIO
+
+
+def load_image(stack: ExitStack, ifs_file: Path, spill_threshold: int = DEFAULT_SPILL_THRESHOLD, jobs: int = 1,
+               index_path: Union[Path, None] = None, lazy: bool = False,
+               located: Union[Tuple[int, int], None] = None, listing: bool = True, pipeline: bool = False,
+               readahead: Union[int, None] = None) \
+        -> Tuple[int, Union[memoryview, 'BlockImage', 'StreamingImage', None], Union[struct_startup_header, None], int,
+                 int]:
+    """
+    open the image of `ifs_file`, decompressing it when needed, what it opens is closed along with `stack`
+    :param index_path: sidecar BlockIndex of a UCL/LZO image, loaded when it matches `ifs_file`, otherwise written
+           after decompressing
+    :param lazy: for a UCL/LZO image, return a BlockImage decompressing only the blocks that get sliced, `pipeline`
+           then only applies to a zlib image
+    :param located: (spos, ipos) of the image to open as found by find_images(), instead of the first image of
+           `ifs_file`. A decompressed image then starts at its startup header rather than at the start of the file.
+    :param listing: print the sizes of the startup header
+    :param pipeline: for a compressed image without `index_path`, return a StreamingImage decompressing it on a thread
+           while it is read
+    :param readahead: with `pipeline`, decompress no further than `readahead` bytes past what is read, see
+           StreamingImage
+    :return: errno, image, shdr, spos (-1 without startup header), ipos (-1 when to be searched after the startup),
+             both positions in `image`
+    """
+    index = load_block_index(index_path, ifs_file) if index_path is not None else None
+    if index is not None:
+        shdr = index.startup_header()
+        if listing:
+            display_startup_sizes(shdr)
+        fin = stack.enter_context(ifs_file.open('rb'))
+        src = stack.enter_context(FileMap(fin.fileno()))
+        decode_block = block_decoder(shdr.flags1 & STARTUP_HDR_FLAGS1_COMPRESS_MASK,
+                                     [src[off:off + in_len] for off, in_len, _ in index.blocks[:TUNE_BLOCKS]])
+        if decode_block is None:
+            return errno.EIO, None, None, -1, -1
+        return 0, stack.enter_context(BlockImage.from_index(src, index, decode_block, jobs)), shdr, index.spos, -1
+
+    fin = stack.enter_context(ifs_file.open('rb'))
+    if os.fstat(fin.fileno()).st_size == 0:
+        logger.warning(f'{ifs_file=} is empty')
+        return errno.EINVAL, None, None, -1, -1
+    src = stack.enter_context(FileMap(fin.fileno()))
+    spos, ipos = locate_image(src) if located is None else located
+    if spos == -1:
+        if ipos == -1:
+            logger.warning(f'{fin=} unable to find startup_header_pattern or image_header_pattern')
+            return errno.EINVAL, None, None, -1, -1
+        image = memoryview(src)
+        stack.callback(image.release)
+        return 0, image, None, -1, ipos
+    buf = src[spos:spos + sizeof(struct_startup_header)]
+    try:
+        shdr = parse_startup_header(buf)
+    except IFSFormatError as ex:
+        logger.warning(f'{ex} @0x{spos:x}')
+        return errno.EINVAL, None, None, -1, -1
+    if listing:
+        display_startup_sizes(shdr)
+
+    cmpr_algo = shdr.flags1 & STARTUP_HDR_FLAGS1_COMPRESS_MASK
+    if lazy and is_block_compression(cmpr_algo):
+        data_start = spos + shdr.startup_size
+        blocks = scan_blocks(src, data_start)
+        decode_block = block_decoder(cmpr_algo, [src[off:off + in_len] for off, in_len in blocks[:TUNE_BLOCKS]])
+        if decode_block is None:
+            return errno.EIO, None, None, -1, -1
+        image = stack.enter_context(BlockImage(src, blocks, data_start, decode_block, jobs))
+        if index_path is not None:
+            # the index needs the decompressed offset of every block, so it costs one full decompression
+            image.prefetch([(0, sys.maxsize)])
+            save_block_index(index_path, BlockIndex(file_sha256(ifs_file), *file_stamp(ifs_file), spos, buf,
+                                                    len(image), image.block_table()))
+        return 0, image, shdr, spos, -1
+
+    if cmpr_algo == STARTUP_HDR_FLAGS1_COMPRESS_NONE:
+        # stored as-is, the image is the input file itself, up to the end of this image as another one may follow it
+        end = spos + shdr.stored_size if shdr.stored_size > shdr.startup_size else len(src)
+        image = memoryview(src)[:min(end, len(src))]
+        stack.callback(image.release)
+        return 0, image, shdr, spos, -1
+
+    image_buf = stack.enter_context(ImageBuffer(spill_threshold))
+    block_table = [] if index_path is not None else None
+    base = spos if located is not None else 0
+    if pipeline and index_path is None:
+        image = stack.enter_context(StreamingImage(image_buf, readahead).start(fin, shdr, spos, jobs, base))
+        return 0, image, shdr, spos - base, -1
+    res = decompress_ifs(fin, shdr, spos, image_buf, jobs, block_table, base)
+    if res != 0:
+        return res, None, None, -1, -1
+    if block_table:
+        save_block_index(index_path, BlockIndex(file_sha256(ifs_file), *file_stamp(ifs_file), spos, buf,
+                                                image_buf.tell(), block_table))
+    image = image_buf.view()
+    stack.callback(image.release)
+    return 0, image, shdr, spos - base, -1
+
+
+def cat(ifs_file: Path, path: str, out: BinaryIO, spill_threshold: int = DEFAULT_SPILL_THRESHOLD, jobs: int = 1,
+        index_path: Union[Path, None] = None) -> int:
+    """
+    write the regular file at `path` of the image to `out`, following symlinks inside the image
+    """
+    try:
+        with IFSImage(ifs_file, spill_threshold, jobs, index_path) as ifs, ifs.open(path) as fin:
+            shutil.copyfileobj(fin, out, BLOCK_SIZE)
+            out.flush()
+            return 0
+    except IFSFormatError as ex:
+        logger.warning(f'{ex}')
+        return errno.EINVAL
+    except OSError as ex:
+        logger.error(f'{ex}')
+        return ex.errno or errno.EIO
+
+
+def list_image(ifs_file: Path, spill_threshold: int = DEFAULT_SPILL_THRESHOLD, jobs: int = 1,
+               index_path: Union[Path, None] = None, selector: Union[Callable[[str], bool], None] = None) -> int:
+    """
+    print the listing of the image and the stats of its entries, only decompressing the image as far as its directory
+    :param selector: list only the dirent paths it selects
+    """
+    with ExitStack() as stack:
+        # a UCL/LZO image decompresses only the blocks sliced, the decompression of a zlib one stops once it is closed
+        res, image, shdr, spos, ipos = load_image(stack, ifs_file, spill_threshold, jobs, index_path, lazy=True,
+                                                  pipeline=True)
+        if res != 0:
+            return res
+        try:
+            res, ipos, ihdr = read_image_header(image, shdr, spos, ipos)
+            if res != 0:
+                return res
+            display_image_header(shdr, spos, ihdr, ipos)
+            dirents = parse_directory(image, ihdr, ipos)
+        except IFSFormatError as ex:
+            logger.warning(f'{ex}')
+            return errno.EINVAL
+        except OSError as ex:
+            logger.warning(f'{ex=} while reading {ifs_file}')
+            return ex.errno or errno.EIO
+    if selector is not None:
+        dirents = dirents.select(selector)
+    for dirent in dirents:
+        display_dirent(ipos, dirent)
+    display_stats(dirents)
+    return 0
+
+
+class IFSImage:
+    """
+    read only file system of the image of an IFS file, to inspect it without extracting anything. Files are read
+    through the decompression layer, so for a UCL/LZO image only the blocks covering what is read get decompressed,
+    and a zlib image is only inflated as far as what is read, STREAM_READAHEAD bytes ahead.
+    Paths are relative to the root of the image, with or without a leading /. Not thread safe.
+
+        with IFSImage(Path('qnx.ifs')) as ifs:
+            for dirpath, dirnames, filenames in ifs.walk('/proc/boot'):
+                ...
+            script = ifs.open('/proc/boot/.script').read()
+    """
+
+    def __init__(self, ifs_file: Path, spill_threshold: int = DEFAULT_SPILL_THRESHOLD, jobs: int = 1,
+                 index_path: Union[Path, None] = None):
+        """
+        :raise OSError: when `ifs_file` has no image or it can not be decompressed
+        :raise IFSFormatError: when its directory is corrupt
+        """
+        self.ifs_file = Path(ifs_file)
+        self._stack = ExitStack()
+        try:
+            res, image, shdr, spos, ipos = load_image(self._stack, self.ifs_file, spill_threshold, jobs, index_path,
+                                                      lazy=True, listing=False, pipeline=True,
+                                                      readahead=STREAM_READAHEAD)
+            if res == 0:
+                res, ipos, ihdr = read_image_header(image, shdr, spos, ipos)
+            if res != 0:
+                raise OSError(res, os.strerror(res), str(ifs_file))
+            self.image = image
+            self.shdr = shdr
+            self.ihdr = ihdr
+            self.ipos = ipos
+            self.dirents = parse_directory(image, ihdr, ipos)
+        except BaseException:
+            self._stack.close()
+            raise
+        self._index = {self.dirents.path(i): i for i in range(len(self.dirents))}
+        # names in every directory, including the directories the image has no dirent for
+        self._children: Dict[str, Dict[str, None]] = {'': {}}
+        for path, i in self._index.items():
+            if self.dirents.mode[i] & S_IFMT == S_IFDIR:
+                self._children.setdefault(path, {})
+            while path:
+                parent, name = posixpath.split(path)
+                known = parent in self._children
+                self._children.setdefault(parent, {})[name] = None
+                if known:
+                    break
+                path = parent
+
+    def __enter__(self) -> 'IFSImage':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._stack.close()
+
+    def listdir(self, path: str = '') -> List[str]:
+        """
+        names of the entries of the directory at `path`, in the order of the image directory
+        """
+        path = self._resolve(path)
+        if path not in self._children:
+            raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        return list(self._children[path])
+
+    def stat(self, path: str, follow_symlinks: bool = True) -> os.stat_result:
+        """
+        stat of the entry at `path`, with its mode, ino, uid, gid, size and mtime in the image. A directory the image
+        has no dirent for is reported with mode 0o755, owned by root.
+        """
+        path = self._resolve(path, follow_symlinks)
+        dirent = self._dirent(path)
+        if dirent is None:
+            return os.stat_result((S_IFDIR | 0o755, 0, 0, 1, 0, 0, 0, 0, 0, 0))
+        attr = dirent.attr
+        size = dirent.size if dirent.mode == S_IFREG else len(dirent.target) if dirent.mode == S_IFLNK else 0
+        return os.stat_result((attr.mode, attr.ino, 0, 1, attr.uid, attr.gid, size, attr.mtime, attr.mtime,
+                               attr.mtime))
+
+    def lstat(self, path: str) -> os.stat_result:
+        return self.stat(path, follow_symlinks=False)
+
+    def readlink(self, path: str) -> str:
+        path = self._resolve(path, follow_symlinks=False)
+        dirent = self._dirent(path)
+        if dirent is None or dirent.mode != S_IFLNK:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL), path)
+        return dirent.target
+
+    def walk(self, top: str = '') -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        (dirpath, dirnames, filenames) of every directory under `top`, top down, like os.walk() not following
+        symlinks to directories
+        """
+        top = self._resolve(top)
+        if top not in self._children:
+            return
+        stack = [top]
+        while stack:
+            dirpath = stack.pop()
+            dirnames, filenames = [], []
+            for name in self._children[dirpath]:
+                path = posixpath.join(dirpath, name) if dirpath else name
+                try:
+                    is_dir = self._resolve(path) in self._children
+                except OSError:
+                    is_dir = False
+                (dirnames if is_dir else filenames).append(name)
+            yield dirpath, dirnames, filenames
+            for name in reversed(dirnames):
+                path = posixpath.join(dirpath, name) if dirpath else name
+                if path in self._children:
+                    stack.append(path)
+
+    def open(self, path: str) -> BinaryIO:
+        """
+        the regular file at `path` as a seekable binary file, reading it lazily out of the image
+        """
+        path = self._resolve(path)
+        dirent = self._dirent(path)
+        if dirent is None or dirent.mode == S_IFDIR:
+            raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+        if dirent.mode != S_IFREG:
+            raise OSError(errno.EINVAL, f'{dirent.mode:#o} is not a regular file', path)
+        start = self.ipos + dirent.offset
+        if isinstance(self.image, BlockImage):
+            # the length of a BlockImage is an upper bound until its blocks up to the end of the file are decompressed
+            self.image.prefetch([(start, start + dirent.size)])
+        # the length of a StreamingImage is only known once it is inflated to its end, a file past it fails its reads
+        if not isinstance(self.image, StreamingImage) and start + dirent.size > len(self.image):
+            raise IFSFormatError(f'{path=} is out of image, {dirent.offset=:x} {dirent.size=:x}')
+        return io.BufferedReader(IFSFile(self.image, start, dirent.size, path), BLOCK_SIZE)
+
+    def _dirent(self, path: str) -> Union['Dirent', None]:
+        i = self._index.get(path)
+        return self.dirents[i] if i is not None else None
+
+    def _resolve(self, path: str, follow_symlinks: bool = True) -> str:
+        """
+        path of the entry at `path` once the symlinks on the way are followed, `follow_symlinks` tells whether the
+        last one is
+        """
+        parts = [_ for _ in reversed(path.split('/')) if _]
+        resolved = ''
+        links = 0
+        while parts:
+            name = parts.pop()
+            if name == '.':
+                continue
+            if name == '..':
+                resolved = posixpath.dirname(resolved)
+                continue
+            candidate = posixpath.join(resolved, name) if resolved else name
+            dirent = self._dirent(candidate)
+            if dirent is not None and dirent.mode == S_IFLNK and (parts or follow_symlinks):
+                links += 1
+                if links > MAX_SYMLINKS:
+                    raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), path)
+                if dirent.target.startswith('/'):
+                    resolved = ''
+                parts.extend(_ for _ in reversed(dirent.target.split('/')) if _)
+                continue
+            if dirent is None and candidate not in self._children:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            if parts and candidate not in self._children:
+                raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+            resolved = candidate
+        return resolved
+
+
+class IFSFile(io.RawIOBase):
+    """
+    raw seekable file of the `size` bytes at `start` of an image
+    """
+
+    def __init__(self, image: Union[memoryview, 'BlockImage', 'StreamingImage'], start: int, size: int, name: str):
+        super().__init__()
+        self.image = image
+        self.start = start
+        self.size = size
+        self.name = name
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(min(len(b), self.size - self._pos), 0)
+        if n:
+            pos = self.start + self._pos
+            data = self.image[pos:pos + n]
+            # a bytearray `b` would silently shrink to a short slice
+            if len(data) < n:
+                raise OSError(errno.EIO, f'image ends at 0x{pos + len(data):x}, within the file', self.name)
+            b[:n] = data
+            self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        elif whence != os.SEEK_SET:
+            raise ValueError(f'invalid {whence=}')
+        if offset < 0:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL), self.name)
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def archive(out: BinaryIO, ifs_file: Path, fmt: str = 'tar', spill_threshold: int = DEFAULT_SPILL_THRESHOLD,
+            jobs: int = 1, index_path: Union[Path, None] = None,
+            selector: Union[Callable[[str], bool], None] = None) -> int:
+    """
+    stream the entries of the first image of `ifs_file` to `out` as a tar or cpio archive in a single pass, with
+    their mode, uid, gid and mtime, symlinks and device nodes, nothing is written to the file system
+    :param fmt: one of ARCHIVE_FORMATS
+    :param selector: archive only the dirent paths it selects
+    """
+    with ExitStack() as stack:
+        res, image, shdr, spos, ipos = load_image(stack, ifs_file, spill_threshold, jobs, index_path,
+                                                  lazy=selector is not None)
+        if res != 0:
+            return res
+        writer = TarWriter(out) if fmt == 'tar' else CpioWriter(out)
+        # a lazy BlockImage decompresses while the directory and the files are read, which fails on a corrupt block
+        try:
+            res, ipos, ihdr = read_image_header(image, shdr, spos, ipos)
+            if res != 0:
+                return res
+            display_image_header(shdr, spos, ihdr, ipos)
+            dirents = parse_directory(image, ihdr, ipos)
+            if selector is not None:
+                dirents = dirents.select(selector)
+            if isinstance(image, BlockImage):
+                image.prefetch(dirents.file_ranges(ipos))
+
+            for dirent in dirents:
+                data = b''
+                if dirent.mode == S_IFREG:
+                    if ipos + dirent.offset + dirent.size > len(image):
+                        logger.warning(f'{dirent.path=} is out of image, {dirent.offset=:x} {dirent.size=:x}')
+                        return errno.EINVAL
+                    data = image[ipos + dirent.offset:ipos + dirent.offset + dirent.size]
+                if dirent.path:
+                    writer.add(dirent, data)
+                display_dirent(ipos, dirent)
+                del data
+            writer.close()
+        except IFSFormatError as ex:
+            logger.warning(f'{ex}')
+            return errno.EINVAL
+        except OSError as ex:
+            logger.warning(f'{ex=} while archiving {ifs_file}')
+            return ex.errno or errno.EIO
+    return 0
+
+
+def qnx_major(rdev: int) -> int:
+    # major() and minor() of QNX <sys/types.h>
+    return (rdev >> 10) & 0x3f
+
+
+def qnx_minor(rdev: int) -> int:
+    return rdev & 0x3ff
+
+
+class TarWriter:
+    """
+    GNU tar archive of dirents, written as a stream
+    """
+    TYPES = {S_IFREG: b'0', S_IFDIR: b'5', S_IFLNK: b'2', S_IFCHR: b'3', S_IFBLK: b'4', S_IFIFO: b'6'}
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.offset = 0
+
+    def add(self, dirent: 'Dirent', data: Union[memoryview, bytes] = b''):
+        """
+        :param data: body of a S_IFREG dirent
+        """
+        import tarfile
+        attr = dirent.attr
+        if dirent.mode not in self.TYPES:
+            logger.warning(f'{dirent.path=} {dirent.mode=:#o} has no tar type, left out')
+            return
+        info = tarfile.TarInfo(dirent.path)
+        info.type = self.TYPES[dirent.mode]
+        info.mode = attr.mode & 0o7777
+        info.uid = attr.uid
+        info.gid = attr.gid
+        info.mtime = attr.mtime
+        info.size = len(data)
+        if dirent.mode == S_IFLNK:
+            info.linkname = dirent.target
+        elif dirent.mode in (S_IFCHR, S_IFBLK):
+            info.devmajor = qnx_major(dirent.rdev)
+            info.devminor = qnx_minor(dirent.rdev)
+        self._write(info.tobuf(tarfile.GNU_FORMAT, 'utf-8', 'surrogateescape'))
+        if len(data):
+            self._write(data)
+            self._write(bytes(-len(data) % tarfile.BLOCKSIZE))
+
+    def close(self):
+        import tarfile
+        self._write(bytes(2 * tarfile.BLOCKSIZE))
+        self._write(bytes(-self.offset % tarfile.RECORDSIZE))
+        self.out.flush()
+
+    def _write(self, data: Union[memoryview, bytes]):
+        self.out.write(data)
+        self.offset += len(data)
+
+
+class CpioWriter:
+    """
+    SVR4 "newc" cpio archive of dirents, written as a stream, as cpio -o -H newc does
+    """
+    TRAILER = 'TRAILER!!!'
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.offset = 0
+
+    def add(self, dirent: 'Dirent', data: Union[memoryview, bytes] = b''):
+        """
+        :param data: body of a S_IFREG dirent
+        """
+        attr = dirent.attr
+        if dirent.mode == S_IFLNK:
+            data = dirent.target.encode()
+        rdev = dirent.rdev if dirent.mode in (S_IFCHR, S_IFBLK) else 0
+        self._entry(dirent.path, attr.ino, attr.mode, attr.uid, attr.gid, 2 if dirent.mode == S_IFDIR else 1,
+                    attr.mtime, qnx_major(rdev), qnx_minor(rdev), data)
+
+    def close(self):
+        self._entry(self.TRAILER, 0, 0, 0, 0, 1, 0, 0, 0, b'')
+        self._write(bytes(-self.offset % 512))
+        self.out.flush()
+
+    def _entry(self, path: str, ino: int, mode: int, uid: int, gid: int, nlink: int, mtime: int, rdevmajor: int,
+               rdevminor: int, data: Union[memoryview, bytes]):
+        name = path.encode() + b'\x00'
+        fields = (ino, mode, uid, gid, nlink, mtime, len(data), 0, 0, rdevmajor, rdevminor, len(name), 0)
+        self._write(b'070701' + b''.join(b'%08x' % (_ & 0xffffffff) for _ in fields) + name)
+        self._write(bytes(-self.offset % 4))
+        self._write(data)
+        self._write(bytes(-self.offset % 4))
+
+    def _write(self, data: Union[memoryview, bytes]):
+        self.out.write(data)
+        self.offset += len(data)
+
+
+class FoundImage(NamedTuple):
+    spos: int  # -1 without startup header
+    ipos: int  # -1 when the image header is after the startup, possibly compressed
+    size: int  # bytes the image takes in the input
+
+
+def find_images(src: Union[mmap.mmap, bytes]) -> List[FoundImage]:
+    """
+    every image in `src`, the signatures found inside an image are taken as part of it
+    """
+    images = []
+    end = 0
+    for kind, pos in scan_headers(src):
+        if pos < end:
+            continue
+        if kind == 'startup':
+            shdr = parse_startup_header(src[pos:pos + sizeof(struct_startup_header)].ljust(
+                sizeof(struct_startup_header), b'\x00'))
+            size = shdr.stored_size if shdr.stored_size > shdr.startup_size else sizeof(struct_startup_header)
+            images.append(FoundImage(pos, -1, size))
+        else:
+            ihdr = parse_image_header(src[pos:pos + sizeof(struct_image_header)].ljust(
+                sizeof(struct_image_header), b'\x00'))
+            size = max(ihdr.image_size, sizeof(struct_image_header))
+            images.append(FoundImage(-1, pos, size))
+        end = pos + images[-1].size
+    return images
+
+
+def process_all(ifs_file: Path, outputdir: Path, spill_threshold: int = DEFAULT_SPILL_THRESHOLD, jobs: int = 1,
+                workers: int = 1, store_root: Union[Path, None] = None, incremental: bool = False,
+                writers: int = 1, only: Union[List[str], None] = None, exclude: Union[List[str], None] = None,
+                pipeline: bool = False) -> int:
+    """
+    extract every image found in `ifs_file`, e.g. a whole flash dump, each into its own subdirectory of `outputdir`
+    on a pool of `workers` processes, then print their listings and a summary
+    :param store_root: BlobStore the extracted files are hardlinked to
+    :param incremental: update the subdirectories after their Manifest
+    :param writers: threads writing the extracted files of each image
+    :param only: globs of path_selector(), extract only the entries of every image matching one
+    :param exclude: globs of path_selector(), do not extract the entries matching one
+    :param pipeline: extract the files of a compressed image as soon as they are decompressed
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    with ifs_file.open('rb') as fin:
+        if os.fstat(fin.fileno()).st_size == 0:
+            logger.warning(f'{ifs_file=} is empty')
+            return errno.EINVAL
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as src:
+            found = find_images(src)
+    if not found:
+        logger.warning(f'{ifs_file=} unable to find startup_header_pattern or image_header_pattern')
+        return errno.EINVAL
+    scheduled = frozenset(image.ipos for image in found if image.ipos != -1)
+    workers = max(1, min(workers, len(found)))
+    jobs = max(1, jobs // workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(extract_found_image, ifs_file, image,
+                                   outputdir / f'ifs{n}_{max(image.spos, image.ipos):08x}', spill_threshold, jobs,
+                                   scheduled, store_root=store_root, incremental=incremental, writers=writers,
+                                   only=only, exclude=exclude, pipeline=pipeline)
+                   for n, image in enumerate(found)]
+        summaries = []
+        for image, future in zip(found, futures):
+            try:
+                summaries.append(future.result())
+            except Exception as ex:
+                logger.warning(f'{ex=} while extracting image @0x{max(image.spos, image.ipos):x}')
+                summaries.append({'offset': max(image.spos, image.ipos), 'status': errno.EIO, 'listing': ''})
+
+    for summary in summaries:
+        print(summary['listing'], end='')
+    print(f'{len(found)} images in {ifs_file}')
+    print('    Offset      Size Compression Endian  Entries  Status  Directory')
+    for image, summary in zip(found, summaries):
+        print(f' {summary["offset"]:9x} {image.size:9x} {summary.get("compression", "-"):>11} '
+              f'{summary.get("endian", "-"):>6} {summary.get("entries", 0):8} {summary["status"]:7}  '
+              f'{summary.get("outputdir", "")}')
+        for chained in summary.get('chained', []):
+            print(f'   chained image header @0x{chained:x} in {summary["outputdir"]}')
+    return next((summary['status'] for summary in summaries if summary['status'] != 0), 0)
+
+
+def extract_found_image(ifs_file: Path, found: Union[FoundImage, None], outputdir: Path,
+                        spill_threshold: int = DEFAULT_SPILL_THRESHOLD, jobs: int = 1,
+                        scheduled: FrozenSet[int] = frozenset(), index_path: Union[Path, None] = None,
+                        store_root: Union[Path, None] = None, incremental: bool = False,
+                        writers: int = 1, only: Union[List[str], None] = None,
+                        exclude: Union[List[str], None] = None, pipeline: bool = False) -> dict:
+    """
+    worker of process_all() and process_batch(), extracts one image and the images chained to it through chain_paddr
+    :param found: None for the first image of `ifs_file`
+    :param scheduled: ipos of the images process_all() extracts on their own, not followed as chained ones
+    :param store_root: BlobStore the extracted files are hardlinked to
+    :param incremental: update `outputdir` after its Manifest
+    :param writers: threads writing the extracted files
+    :param only: globs of path_selector(), passed rather than the selector itself as they cross to a worker process
+    :param exclude: globs of path_selector()
+    :param pipeline: extract the files of a compressed image as soon as they are decompressed
+    :return: summary of the image, with the listing it printed
+    """
+    store = BlobStore(store_root) if store_root is not None else None
+    selector = path_selector(only, exclude)
+    manifest = None
+    summary = {'offset': max(found.spos, found.ipos) if found is not None else 0, 'outputdir': str(outputdir),
+               'chained': []}
+    listing = io.StringIO()
+    with redirect_stdout(listing), ExitStack() as stack:
+        res, image, shdr, spos, ipos = load_image(stack, ifs_file, spill_threshold, jobs, index_path,
+                                                  lazy=selector is not None,
+                                                  located=(found.spos, found.ipos) if found is not None else None,
+                                                  pipeline=pipeline)
+        if res == 0:
+            res, ipos, ihdr = read_image_header(image, shdr, spos, ipos)
+        if res == 0:
+            summary['compression'] = COMPRESSION_NAMES.get(shdr.flags1 & STARTUP_HDR_FLAGS1_COMPRESS_MASK, '?') \
+                if shdr is not None else '-'
+            summary['endian'] = 'big' if ihdr.flags & IMAGE_FLAGS_BIGENDIAN else 'little'
+            outputdir.mkdir(parents=True, exist_ok=True)
+            manifest = Manifest.load(outputdir) if incremental else None
+            res = process_image(image, outputdir, shdr, spos, ihdr, ipos, selector, stats=summary, store=store,
+                                manifest=manifest, writers=writers)
+            # a decompressed image starts at its startup header, positions past the startup only match the input
+            # when it is not compressed
+            base = found.spos - spos if found is not None and found.spos != -1 else 0
+            if found is None:
+                summary['offset'] = spos if spos != -1 else ipos
+            in_input = shdr is None \
+                or shdr.flags1 & STARTUP_HDR_FLAGS1_COMPRESS_MASK == STARTUP_HDR_FLAGS1_COMPRESS_NONE
+            visited = {ipos}
+            while res == 0 and ihdr.chain_paddr:
+                ipos += ihdr.chain_paddr
+                if ipos in visited or (in_input and base + ipos in scheduled) \
+                        or not re.match(image_header_pattern, image[ipos:ipos + 8]):
+                    break
+                visited.add(ipos)
+                summary['chained'].append(base + ipos if in_input else ipos)
+                res, ipos, ihdr = read_image_header(image, None, -1, ipos)
+                if res == 0:
+                    res = process_image(image, outputdir / f'chain{len(visited) - 1}', None, -1, ihdr, ipos,
+                                        selector, stats=summary, store=store, manifest=manifest, writers=writers)
+            if res == 0 and isinstance(image, StreamingImage):
+                # the end of the image may still fail to decompress
+                res = image.result()
+            if manifest is not None:
+                res = manifest.finish(res == 0) or res
+                summary['unchanged'] = manifest.unchanged
+                summary['removed'] = manifest.removed
+                summary['not_removed'] = manifest.not_removed
+    summary['status'] = res
+    if store is not None:
+        summary['bytes_stored'] = store.bytes_stored
+    summary['listing'] = listing.getvalue()
+    return summary
+
+
+def process_batch(jobs: List[Tuple[Path, Path]], report: TextIO, spill_threshold: int = DEFAULT_SPILL_THRESHOLD,
+                  threads: int = 1, workers: int = 1, index: bool = False,
+                  store_root: Union[Path, None] = None, incremental: bool = False, writers: int = 1) -> int:
+    """
+    extract the first image of every IFS file into its output directory on a pool of `workers` processes, and write
+    a json line per file to `report` as soon as it is done. An image that fails, even one that crashes its worker
+    process, only fails its own line.
+    :param jobs: (IFS file, output directory) to extract
+    :param threads: threads decompressing UCL/LZO blocks of one image
+    :param index: load or write the BlockIndex next to each IFS file
+    :param store_root: BlobStore shared by all the images, their identical files are stored once
+    :param incremental: update the output directories of a previous batch after their Manifest
+    :param writers: threads writing the extracted files of an image
+    """
+    import json
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from concurrent.futures.process import BrokenProcessPool
+    from functools import partial
+    res = 0
+    extract = partial(batch_extract, spill_threshold=spill_threshold, jobs=threads, index=index,
+                      store_root=store_root, incremental=incremental, writers=writers)
+
+    def write(record: dict):
+        nonlocal res
+        report.write(json.dumps(record) + '\n')
+        report.flush()
+        if record['status'] != 0 and res == 0:
+            res = record['status']
+
+    broken = []
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as executor:
+        futures = {executor.submit(extract, ifs_file, outputdir): (ifs_file, outputdir) for ifs_file, outputdir in jobs}
+        for future in as_completed(futures):
+            try:
+                write(future.result())
+            except BrokenProcessPool:
+                broken.append(futures[future])
+    # a crashed worker takes every image in flight down with it, find out which one crashed by retrying them one by
+    # one in a process of their own
+    for ifs_file, outputdir in broken:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                write(executor.submit(extract, ifs_file, outputdir).result())
+            except BrokenProcessPool as ex:
+                write({'path': str(ifs_file), 'outputdir': str(outputdir), 'status': errno.EIO,
+                       'errors': [f'worker process crashed: {ex}']})
+    return res
+
+
+def batch_extract(ifs_file: Path, outputdir: Path, spill_threshold: int = DEFAULT_SPILL_THRESHOLD, jobs: int = 1,
+                  index: bool = False, store_root: Union[Path, None] = None, incremental: bool = False,
+                  writers: int = 1) -> dict:
+    """
+    worker of process_batch()
+    :return: json record of the extraction of `ifs_file`
+    """
+    start = time.monotonic()
+    record = {'path': str(ifs_file), 'outputdir': str(outputdir), 'status': 0}
+    errors = ListHandler(logging.WARNING)
+    logging.getLogger().addHandler(errors)
+    try:
+        record['bytes_in'] = ifs_file.stat().st_size
+        if not incremental:
+            rmtree_writable(outputdir)
+        outputdir.mkdir(parents=True, exist_ok=True)
+        summary = extract_found_image(ifs_file, None, outputdir, spill_threshold, jobs,
+                                      index_path=default_index_path(ifs_file) if index else None,
+                                      store_root=store_root, incremental=incremental, writers=writers)
+        del summary['listing']
+        record.update(summary)
+    except Exception as ex:
+        logger.warning(f'{ex=} while extracting {ifs_file}')
+        record['status'] = getattr(ex, 'errno', None) or errno.EIO
+    finally:
+        logging.getLogger().removeHandler(errors)
+    record['errors'] = errors.messages
+    record['seconds'] = round(time.monotonic() - start, 6)
+    return record
+
+
+class ListHandler(logging.Handler):
+    """
+    keeps the messages it handles
+    """
+
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.messages: List[str] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+
+def display_startup_sizes(shdr: struct_startup_header):
+    print(f'Image startup_size: 0x{shdr.startup_size:08x} ')
+    print(f'Image stored_size: 0x{shdr.stored_size:08x} ')
+    print(f'Compressed size: 0x{shdr.stored_size - shdr.startup_size - sizeof(struct_image_trailer)}')
+
+
+class FileMap(mmap.mmap):
+    """
+    read only map of a whole file which keeps its descriptor, the slices of a memoryview of it are then copied to the
+    extracted files in the kernel rather than through the map
+    """
+
+    def __new__(cls, fd: int):
+        self = super().__new__(cls, fd, 0, access=mmap.ACCESS_READ)
+        self.fd = fd
+        return self
+
+
+class ImageBuffer:
+    """
+    decompressed image, kept in memory until it grows over `spill_threshold` bytes and spilled to an anonymous
+    temp file from then on
+    """
+
+    def __init__(self, spill_threshold: int = DEFAULT_SPILL_THRESHOLD):
+        self.spill_threshold = spill_threshold
+        self._buf = bytearray()
+        self._file: Union[BinaryIO, None] = None
+        self._mmap: Union[FileMap, None] = None
+
+    def __enter__(self) -> 'ImageBuffer':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, data) -> int:
+        if self._file is None and len(self._buf) + len(data) > self.spill_threshold:
+            logger.debug(f'spill decompressed image to disk, {self.spill_threshold=}')
+            import tempfile
+            self._file = tempfile.TemporaryFile(prefix='ifs_decompressed', suffix='.bin')
+            self._file.write(self._buf)
+            self._buf = bytearray()
+        if self._file is not None:
+            return self._file.write(data)
+        self._buf += data
+        return len(data)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def tell(self) -> int:
+        return self._file.tell() if self._file is not None else len(self._buf)
+
+    def read(self, start: int, stop: int) -> bytes:
+        """
+        copy of [start, stop) of what is written so far, unlike view() it does not keep the buffer from growing
+        """
+        if self._file is None:
+            with memoryview(self._buf) as view:
+                return view[start:stop].tobytes()
+        self._file.flush()
+        return os.pread(self._file.fileno(), stop - start, start)
+
+    def view(self) -> memoryview:
+        """
+        the whole image written so far, the caller releases the view before closing the buffer
+        """
+        if self._file is None:
+            return memoryview(self._buf)
+        self._file.flush()
+        if self._mmap is None:
+            self._mmap = FileMap(self._file.fileno())
+        return memoryview(self._mmap)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._buf = bytearray()
+
+
+class StreamingImage:
+    """
+    decompressed image written into an ImageBuffer by decompress_ifs() on a thread of its own. Slicing it waits until
+    the slice is decompressed, so the directory and the files at the front of the image are extracted while the rest
+    of it is still being decompressed. The slices are copies, the buffer keeps growing under them.
+    """
+
+    def __init__(self, buf: ImageBuffer, readahead: Union[int, None] = None):
+        """
+        :param readahead: the decompression waits once it is `readahead` bytes past the end of the last slice, until
+               a slice further on is wanted. None to decompress the whole image right away.
+        """
+        self.buf = buf
+        self.readahead = readahead
+        self._written = 0
+        self._done = False
+        self._cancelled = False
+        self._res = 0
+        self._wanted = 0  # end of the slice waited for
+        self._cond = threading.Condition()
+        self._thread: Union[threading.Thread, None] = None
+
+    def __enter__(self) -> 'StreamingImage':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self, fin: BinaryIO, shdr: struct_startup_header, spos: int, jobs: int = 1,
+              base: int = 0) -> 'StreamingImage':
+        """
+        start decompressing the image, with the arguments of decompress_ifs()
+        """
+        self._thread = threading.Thread(target=self._decompress, args=(fin, shdr, spos, jobs, base),
+                                        name='decompress', daemon=True)
+        self._thread.start()
+        return self
+
+    def _decompress(self, fin: BinaryIO, shdr: struct_startup_header, spos: int, jobs: int, base: int):
+        res = errno.EIO
+        try:
+            res = decompress_ifs(fin, shdr, spos, self, jobs, None, base)
+        except OSError as ex:
+            if not self._cancelled:
+                logger.warning(f'{ex=} while decompressing')
+            res = ex.errno or errno.EIO
+        except Exception as ex:
+            # e.g. a MemoryError of a decoder, the reader would otherwise wait for the image forever
+            logger.error(f'{ex=} while decompressing', exc_info=True)
+        finally:
+            with self._cond:
+                self._res = res
+                self._done = True
+                self._cond.notify_all()
+
+    def write(self, data) -> int:
+        with self._cond:
+            if self.readahead is not None:
+                self._cond.wait_for(lambda: self._cancelled or self._written < self._wanted + self.readahead)
+            if self._cancelled:
+                raise OSError(errno.ECANCELED, 'image no longer read')
+            n = self.buf.write(data)
+            self._written += n
+            # only wake the reader once what it waits for is there
+            if self._written >= self._wanted:
+                self._cond.notify_all()
+        return n
+
+    def flush(self):
+        with self._cond:
+            self.buf.flush()
+
+    def tell(self) -> int:
+        return self._written
+
+    def __len__(self) -> int:
+        with self._cond:
+            self._wanted = sys.maxsize
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._done)
+            return self._written
+
+    def __getitem__(self, key: slice) -> bytes:
+        stop = key.stop if key.stop is not None else sys.maxsize
+        with self._cond:
+            self._wanted = stop
+            # wakes the decompression as well, when it waits within its readahead
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._done or self._written >= stop)
+            if self._written < stop and self._res != 0:
+                raise OSError(self._res, f'decompress failed before 0x{stop:x}')
+            start, stop, _ = key.indices(self._written)
+            if start >= stop:
+                return b''
+            return self.buf.read(start, stop)
+
+    def result(self) -> int:
+        """
+        wait until the whole image is decompressed
+        :return: errno of decompress_ifs()
+        """
+        with self._cond:
+            self._wanted = sys.maxsize
+            self._cond.notify_all()
+        self._thread.join()
+        return self._res
+
+    def close(self):
+        """
+        stop decompressing, when the image is not read to its end
+        """
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def parse_startup_header(buf: Union[memoryview, bytes]) -> struct_startup_header:
+    """
+    struct_startup_header at the start of `buf`, decoded in the byte order its flags1 tells
+    :raise IFSFormatError: `buf` ends before the end of the header
+    """
+    if len(buf) < sizeof(struct_startup_header):
+        raise IFSFormatError(f'startup header truncated to {len(buf)} bytes')
+    if buf[struct_startup_header.flags1.offset] & STARTUP_HDR_FLAGS1_BIGENDIAN:
+        return struct_startup_header_be.from_buffer_copy(buf)
+    return struct_startup_header.from_buffer_copy(buf)
+
+
+def decompress_ifs(fin: BinaryIO, shdr: struct_startup_header, spos: int, fout: Union[ImageBuffer, StreamingImage],
+                   jobs: int = 1,
+                   block_table: Union[List[Tuple[int, int, int]], None] = None, base: int = 0) -> int:
+    """
+    an image stored without compression is not decompressed, load_image() reads it straight from the input file
+    :param block_table: when not None, (compressed offset, compressed length, decompressed offset) of every UCL/LZO
+           block is appended to it
+    :param base: pos of `fin` the decompressed image starts from, what precedes it is left out
+    """
+    fin.seek(base)
+    fout.write(fin.read(spos + shdr.startup_size - base))
+    fout.flush()
+    cmpr_algo = shdr.flags1 & STARTUP_HDR_FLAGS1_COMPRESS_MASK
+    if cmpr_algo in STREAM_DECOMPRESSORS:
+        return STREAM_DECOMPRESSORS[cmpr_algo](fin, fout)
+
+    elif is_block_compression(cmpr_algo):
+        return decompress_blocks(fin, fout, cmpr_algo, jobs, block_table)
+
+    logger.warning(f'{cmpr_algo=:#04x} unknown compression')
+    return errno.EINVAL
+
+
+_libraries: Dict[str, Union[CDLL, None]] = {}
+_libraries_lock = threading.Lock()
+
+
+def decompressor_library(name: str) -> Union[CDLL, None]:
+    """
+    the decompressor library `name` of DECOMPRESSOR_LIBRARIES with the prototypes of the functions dumpifs calls,
+    loaded once per process from the path of its environment variable, or else looked up by find_library(), which
+    runs ldconfig
+    :return: None when it can not be loaded, which is remembered as well
+    """
+    with _libraries_lock:
+        if name not in _libraries:
+            _libraries[name] = load_decompressor_library(name)
+        return _libraries[name]
+
+
+def load_decompressor_library(name: str) -> Union[CDLL, None]:
+    path = os.environ.get(DECOMPRESSOR_LIBRARIES[name])
+    if not path:
+        from ctypes.util import find_library
+        path = find_library(name)
+    if path is None:
+        # another backend may decode the same compression
+        logger.debug(f'unable to find lib{name}, set {DECOMPRESSOR_LIBRARIES[name]} to its path')
+        return None
+    try:
+        lib = CDLL(path)
+        if name == 'lzo2':
+            lib.lzo_version.argtypes = []
+            lib.lzo_version.restype = c_uint
+            # lzo_init() is a macro passing the sizes of the types of lzoconf.h along
+            lib.__lzo_init_v2.argtypes = [c_uint] + [c_int] * 9
+            lib.__lzo_init_v2.restype = c_int
+            lib.lzo1x_decompress_safe.argtypes = [c_void_p, c_size_t, c_void_p, POINTER(c_size_t), c_void_p]
+            lib.lzo1x_decompress_safe.restype = c_int
+        elif name == 'ucl':
+            lib.ucl_nrv2b_decompress_safe_8.argtypes = [c_void_p, c_uint, c_void_p, POINTER(c_uint), c_void_p]
+            lib.ucl_nrv2b_decompress_safe_8.restype = c_int
+    except (OSError, AttributeError) as ex:
+        logger.error(f'unable to load lib{name} from {path}: {ex}')
+        return None
+    if name == 'lzo2':
+        pointer = sizeof(c_void_p)
+        # short, int, long, lzo_uint32_t, lzo_uint, lzo_sizeof_dict_t, char *, lzo_voidp, lzo_callback_t
+        res = lib.__lzo_init_v2(lib.lzo_version(), sizeof(c_ushort), sizeof(c_int), sizeof(c_long),
+                                sizeof(c_uint32), sizeof(c_size_t), pointer, pointer, pointer, 6 * pointer)
+        if res != 0:
+            logger.error(f'lzo_init() failed, {res=}')
+            return None
+    return lib
+
+
+def zlib_chunk_size() -> int:
+    """
+    ZLIB_CHUNK_SIZE, or the KiB of $DUMPIFS_ZLIB_CHUNK_KB
+    """
+    chunk_kb = os.environ.get('DUMPIFS_ZLIB_CHUNK_KB')
+    if not chunk_kb:
+        return ZLIB_CHUNK_SIZE
+    try:
+        chunk_size = int(chunk_kb) * 1024
+    except ValueError:
+        chunk_size = 0
+    if chunk_size <= 0:
+        logger.warning(f'DUMPIFS_ZLIB_CHUNK_KB={chunk_kb!r} is not a positive number of KiB, using '
+                       f'{ZLIB_CHUNK_SIZE // 1024}')
+        return ZLIB_CHUNK_SIZE
+    return chunk_size
+
+
+def decompress_zlib(fin: BinaryIO, fout: ImageBuffer, chunk_size: Union[int, None] = None,
+                    output_size: Union[int, None] = None) -> int:
+    """
+    inflate the gzip stream starting at the current position of `fin`, and the gzip members concatenated to it, fed
+    from a map of `fin` in slices of `chunk_size` bytes and inflated at most `output_size` bytes at a time
+    :param chunk_size: zlib_chunk_size() by default
+    :param output_size: ZLIB_OUTPUT_RATIO times `chunk_size` by default
+    :return: EIO when the stream is corrupt or ends before its end of stream marker
+    """
+    import zlib
+    chunk_size = chunk_size or zlib_chunk_size()
+    output_size = output_size or ZLIB_OUTPUT_RATIO * chunk_size
+    pos = fin.tell()
+    with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as src, memoryview(src) as view:
+        # 32 + MAX_WBITS takes a gzip or a zlib header
+        inflater = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        try:
+            while pos < len(view):
+                if inflater.eof:
+                    if view[pos:pos + 2] != b'\x1f\x8b':
+                        break
+                    inflater = zlib.decompressobj(32 + zlib.MAX_WBITS)
+                with view[pos:pos + chunk_size] as chunk:
+                    fout.write(inflater.decompress(chunk, output_size))
+                    # the input left over by output_size, or following the end of a member, is fed again from view
+                    pos += len(chunk) - len(inflater.unused_data if inflater.eof else inflater.unconsumed_tail)
+            fout.write(inflater.flush())
+        except zlib.error as ex:
+            logger.error(f'zlib decompress failed @0x{pos:x}: {ex}')
+            return errno.EIO
+    if not inflater.eof:
+        logger.warning(f'zlib stream is truncated @0x{pos:x}')
+        return errno.EIO
+    return 0
+
+
+# decompressor(fin, fout) of the compressions stored as one stream rather than as independent blocks
+STREAM_DECOMPRESSORS: Dict[int, Callable[[BinaryIO, ImageBuffer], int]] = {
+    STARTUP_HDR_FLAGS1_COMPRESS_ZLIB: decompress_zlib,
+}
+
+
+# decode_block(src, in_len, dst) of a block decoder backend: it decompresses the `in_len` bytes at `src`, an address
+# or bytes, straight into `dst`, a ctypes buffer of BLOCK_SIZE bytes, and returns the status and the decompressed length
+BlockDecoder = Callable[[Union[int, bytes], int, Array], Tuple[int, int]]
+
+
+class BlockBackend(NamedTuple):
+    name: str
+    cmpr_algo: int
+    load: Callable[[], Union[BlockDecoder, None]]  # None when the backend is not available on this host
+    fallback: bool = False  # only loaded when no other backend of cmpr_algo is available
+
+
+# every block decoder backend, in order of preference before block_decoder() times them
+BLOCK_BACKENDS: List[BlockBackend] = []
+# compressed blocks of the image at hand every available backend decodes to pick the fastest one
+TUNE_BLOCKS = 16
+TUNE_ROUNDS = 3
+
+
+def register_block_backend(name: str, cmpr_algo: int, load: Callable[[], Union[BlockDecoder, None]],
+                           fallback: bool = False):
+    BLOCK_BACKENDS.append(BlockBackend(name, cmpr_algo, load, fallback))
+
+
+def is_block_compression(cmpr_algo: int) -> bool:
+    return any(backend.cmpr_algo == cmpr_algo for backend in BLOCK_BACKENDS)
+
+
+def load_liblzo2() -> Union[BlockDecoder, None]:
+    lib = decompressor_library('lzo2')
+    if lib is None:
+        return None
+
+    def decode_block(src: Union[int, bytes], in_len: int, dst: Array) -> Tuple[int, int]:
+        out_len = c_size_t(BLOCK_SIZE)
+        status = lib.lzo1x_decompress_safe(src, in_len, dst, byref(out_len), None)
+        return status, out_len.value
+
+    return decode_block
+
+
+def load_python_lzo() -> Union[BlockDecoder, None]:
+    try:
+        import lzo
+    except ImportError:
+        return None
+
+    def decode_block(src: Union[int, bytes], in_len: int, dst: Array) -> Tuple[int, int]:
+        try:
+            data = lzo.decompress(string_at(src, in_len) if isinstance(src, int) else src, False, BLOCK_SIZE)
+        except lzo.error:
+            return -1, 0  # LZO_E_ERROR
+        memmove(dst, data, len(data))
+        return 0, len(data)
+
+    return decode_block
+
+
+def load_libucl() -> Union[BlockDecoder, None]:
+    lib = decompressor_library('ucl')
+    if lib is None:
+        return None
+
+    def decode_block(src: Union[int, bytes], in_len: int, dst: Array) -> Tuple[int, int]:
+        out_len = c_uint(BLOCK_SIZE)
+        status = lib.ucl_nrv2b_decompress_safe_8(src, in_len, dst, byref(out_len), None)
+        return status, out_len.value
+
+    return decode_block
+
+
+def load_nrv2b() -> Union[BlockDecoder, None]:
+    import nrv2b
+    if nrv2b.numba is None:
+        # not an error of the image at hand, which the warnings of a batch record are
+        logger.info('no libucl, decoding UCL blocks in pure Python, numba would compile the decoder')
+
+    def decode_block(src: Union[int, bytes], in_len: int, dst: Array) -> Tuple[int, int]:
+        return nrv2b.decompress_into(string_at(src, in_len) if isinstance(src, int) else src, dst)
+
+    return decode_block
+
+
+register_block_backend('liblzo2', STARTUP_HDR_FLAGS1_COMPRESS_LZO, load_liblzo2)
+register_block_backend('python-lzo', STARTUP_HDR_FLAGS1_COMPRESS_LZO, load_python_lzo)
+register_block_backend('libucl', STARTUP_HDR_FLAGS1_COMPRESS_UCL, load_libucl)
+register_block_backend('nrv2b', STARTUP_HDR_FLAGS1_COMPRESS_UCL, load_nrv2b, fallback=True)
+
+_decoders: Dict[int, Union[BlockDecoder, None]] = {}
+_decoders_lock = threading.Lock()
+
+
+def block_decoder(cmpr_algo: int, samples: Sequence[bytes] = ()) -> Union[BlockDecoder, None]:
+    """
+    decoder of the UCL or LZO blocks of an image, the backend is chosen once per process
+    :param samples: compressed blocks of the image, to time the available backends on when this host has no choice
+           cached yet
+    """
+    with _decoders_lock:
+        if cmpr_algo not in _decoders:
+            _decoders[cmpr_algo] = select_block_decoder(cmpr_algo, samples)
+        return _decoders[cmpr_algo]
+
+
+def select_block_decoder(cmpr_algo: int, samples: Sequence[bytes]) -> Union[BlockDecoder, None]:
+    """
+    the fastest backend of `cmpr_algo` available on this host, after the choice cached in decoder_tuning_path() when
+    the same backends were available then, or else after timing them on `samples` and caching the result. Without
+    samples the first available backend is taken.
+    """
+    name = COMPRESSION_NAMES[cmpr_algo]
+    backends = [backend for backend in BLOCK_BACKENDS if backend.cmpr_algo == cmpr_algo]
+    available = {}
+    for fallback in (False, True):
+        for backend in backends:
+            if backend.fallback == fallback:
+                decode_block = backend.load()
+                if decode_block is not None:
+                    available[backend.name] = decode_block
+        if available:
+            break
+    if not available:
+        logger.error(f'no {name} decoder available, tried {", ".join(backend.name for backend in backends)}')
+        return None
+    candidates = list(available)
+    if len(candidates) == 1 or not samples:
+        return available[candidates[0]]
+
+    key = f'{os.uname().nodename}:{name}'
+    tuning = load_decoder_tuning()
+    entry = tuning.get(key, {})
+    if entry.get('candidates') == candidates and entry.get('backend') in available:
+        return available[entry['backend']]
+    seconds = time_block_decoders(available, samples)
+    if not seconds:
+        logger.warning(f'every {name} decoder failed on the first blocks, using {candidates[0]}')
+        return available[candidates[0]]
+    choice = min(seconds, key=seconds.get)
+    logger.info(f'{name} decoder: {choice}, the fastest of {seconds}')
+    tuning[key] = {'backend': choice, 'candidates': candidates, 'seconds': seconds}
+    save_decoder_tuning(tuning)
+    return available[choice]
+
+
+def time_block_decoders(decoders: Dict[str, BlockDecoder], samples: Sequence[bytes]) -> Dict[str, float]:
+    """
+    seconds each decoder takes to decode `samples`, best of TUNE_ROUNDS, leaving out the ones failing on them or
+    decoding them differently from the first one that succeeds
+    """
+    out_buf = create_string_buffer(BLOCK_SIZE)
+    expected = None
+    seconds = {}
+    for name, decode_block in decoders.items():
+        outputs = []
+        for payload in samples:
+            status, out_len = decode_block(payload, len(payload), out_buf)
+            if status != 0:
+                break
+            outputs.append(out_buf.raw[:out_len])
+        if len(outputs) != len(samples) or outputs != (expected if expected is not None else outputs):
+            logger.warning(f'{name} decoder failed on the sample blocks, it is left out')
+            continue
+        expected = outputs
+        best = float('inf')
+        for _ in range(TUNE_ROUNDS):
+            start = time.perf_counter()
+            for payload in samples:
+                decode_block(payload, len(payload), out_buf)
+            best = min(best, time.perf_counter() - start)
+        seconds[name] = best
+    return seconds
+
+
+def decoder_tuning_path() -> Path:
+    """
+    per user cache of the backends block_decoder() chose on every host sharing it
+    """
+    return Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'dumpifs' / 'decoders.json'
+
+
+def load_decoder_tuning() -> dict:
+    import json
+    try:
+        with decoder_tuning_path().open() as fin:
+            tuning = json.load(fin)
+    except (OSError, ValueError) as ex:
+        logger.debug(f'no decoder tuning: {ex}')
+        return {}
+    return tuning if isinstance(tuning, dict) else {}
+
+
+def save_decoder_tuning(tuning: dict):
+    import json
+    path = decoder_tuning_path()
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open('w') as fout:
+            json.dump(tuning, fout, indent=1)
+        os.replace(tmp_path, path)
+    except OSError as ex:
+        logger.warning(f'unable to save the decoder tuning to {path}: {ex}')
+
+
+def scan_blocks(src: mmap.mmap, pos: int) -> List[Tuple[int, int]]:
+    """
+    walk the chain of `[u16 big-endian length][payload]` compressed blocks up to the zero length terminator
+    :return: (offset, length) of every payload
+    """
+    blocks = []
+    while pos + 2 <= len(src):
+        in_len, = unpack_from('>H', src, pos)
+        if in_len == 0:
+            break
+        if pos + 2 + in_len > len(src):
+            logger.warning(f'compressed block @0x{pos:x} {in_len=} is truncated')
+            break
+        blocks.append((pos + 2, in_len))
+        pos += 2 + in_len
+    return blocks
+
+
+def decompress_blocks(fin: BinaryIO, fout: ImageBuffer, cmpr_algo: int, jobs: int,
+                      block_table: Union[List[Tuple[int, int, int]], None] = None) -> int:
+    """
+    decompress the independent blocks starting at the current position of `fin` in two phases: scan all the block
+    offsets first, then decode them on a pool of `jobs` threads (the ctypes calls release the GIL) and write the
+    outputs in order.
+    The blocks are decoded from their address in a private map of `fin` into a ring of 2 * `jobs` reusable output
+    buffers, which are written out through a memoryview, so no block is copied into a bytes object on the way.
+    """
+    name = COMPRESSION_NAMES[cmpr_algo].upper()
+    with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_COPY) as src:
+        blocks = scan_blocks(src, fin.tell())
+        decode_block = block_decoder(cmpr_algo, [src[off:off + in_len] for off, in_len in blocks[:TUNE_BLOCKS]])
+        if decode_block is None:
+            return errno.EIO
+        print(f'{name} Decompress @0x{fin.tell():016x} {len(blocks)} blocks')
+        # a writable map, so that ctypes hands out its address; nothing writes to it
+        mapped = (c_char * len(src)).from_buffer(src)
+        base = addressof(mapped)
+        executor = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        free = [create_string_buffer(BLOCK_SIZE) for _ in range(2 * jobs if executor else 1)]
+        pending = deque()
+        til, tol = 0, 0
+
+        def write_block(off: int, in_len: int, out_buf: Array, status: int, out_len: int) -> int:
+            nonlocal til, tol
+            if status != 0:
+                logger.warning(f'{name} decompress failed, {status=} @0x{off - 2:x}')
+                return errno.EINVAL
+            if block_table is not None:
+                block_table.append((off, in_len, fout.tell()))
+            til += in_len; tol += out_len
+            logger.debug(f'{name} Decompressed rd={in_len} (0x{in_len:x}) wr={out_len}, 0x{off - 2:x}')
+            with memoryview(out_buf) as view:
+                fout.write(view[:out_len])
+            free.append(out_buf)
+            return 0
+
+        try:
+            for off, in_len in blocks:
+                if not free:
+                    p_off, p_len, p_buf, future = pending.popleft()
+                    res = write_block(p_off, p_len, p_buf, *future.result())
+                    if res != 0:
+                        return res
+                out_buf = free.pop()
+                if executor:
+                    pending.append((off, in_len, out_buf, executor.submit(decode_block, base + off, in_len, out_buf)))
+                else:
+                    res = write_block(off, in_len, out_buf, *decode_block(base + off, in_len, out_buf))
+                    if res != 0:
+                        return res
+            while pending:
+                p_off, p_len, p_buf, future = pending.popleft()
+                res = write_block(p_off, p_len, p_buf, *future.result())
+                if res != 0:
+                    return res
+        finally:
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+            del mapped
+    if g_verbose:
+        print(f'Decompressed {til} bytes -> {tol} bytes')
+    return 0
+
+
+class BlockIndex:
+    """
+    seek index of a UCL/LZO image, saved as a json sidecar so later runs can decompress any block on its own
+    """
+    VERSION = 1
+
+    def __init__(self, sha256: str, size: int, mtime_ns: int, spos: int, shdr_raw: bytes, image_size: int,
+                 blocks: List[Tuple[int, int, int]]):
+        """
+        :param sha256: of the whole input file
+        :param size: st_size of the input file
+        :param mtime_ns: st_mtime_ns of the input file
+        :param spos: pos of struct_startup_header
+        :param shdr_raw: struct_startup_header as stored in the input file
+        :param image_size: size of the decompressed image, including what precedes the compressed blocks
+        :param blocks: (compressed offset, compressed length, decompressed offset) of every block
+        """
+        self.sha256 = sha256
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.spos = spos
+        self.shdr_raw = shdr_raw
+        self.image_size = image_size
+        self.blocks = blocks
+
+    def startup_header(self) -> struct_startup_header:
+        return parse_startup_header(self.shdr_raw)
+
+    def to_json(self) -> dict:
+        return {'version': self.VERSION, 'sha256': self.sha256, 'size': self.size, 'mtime_ns': self.mtime_ns,
+                'spos': self.spos, 'startup_header': self.shdr_raw.hex(), 'image_size': self.image_size,
+                'blocks': self.blocks}
+
+    @classmethod
+    def from_json(cls, obj: dict) -> 'BlockIndex':
+        if obj['version'] != cls.VERSION:
+            raise ValueError(f'unsupported index version {obj["version"]}')
+        return cls(obj['sha256'], obj['size'], obj['mtime_ns'], obj['spos'], bytes.fromhex(obj['startup_header']),
+                   obj['image_size'], [tuple(_) for _ in obj['blocks']])
+
+
+def default_index_path(ifs_file: Path) -> Path:
+    return ifs_file.with_name(ifs_file.name + '.idx.json')
+
+
+def file_stamp(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def file_sha256(path: Path) -> str:
+    import hashlib
+    with path.open('rb') as fin, mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as src:
+        return hashlib.sha256(src).hexdigest()
+
+
+def save_block_index(index_path: Path, index: BlockIndex):
+    import json
+    tmp_path = index_path.with_name(index_path.name + '.tmp')
+    try:
+        with tmp_path.open('w') as fout:
+            json.dump(index.to_json(), fout)
+        os.replace(tmp_path, index_path)
+    except OSError as ex:
+        logger.warning(f'{ex=} while writing {index_path=}')
+
+
+def load_block_index(index_path: Path, ifs_file: Path) -> Union[BlockIndex, None]:
+    """
+    :return: None when there is no index for `ifs_file` or it belongs to another content
+    """
+    import json
+    try:
+        with index_path.open('r') as fin:
+            index = BlockIndex.from_json(json.load(fin))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as ex:
+        logger.warning(f'{ex=} while loading {index_path=}')
+        return None
+    if file_stamp(ifs_file) != (index.size, index.mtime_ns) and file_sha256(ifs_file) != index.sha256:
+        logger.info(f'{index_path=} is stale')
+        return None
+    return index
+
+
+class BlockImage:
+    """
+    decompressed image backed by the compressed UCL/LZO input, slicing it only decompresses the blocks covering the
+    slice, each of them once. Without a BlockIndex the decompressed offset of a block is only known once all the
+    blocks before it are decompressed, so they are decompressed in order as far as the slices reach.
+    """
+
+    def __init__(self, src: mmap.mmap, blocks: List[Tuple[int, int]], data_start: int,
+                 decode_block: BlockDecoder, jobs: int = 1,
+                 doffs: Union[List[int], None] = None, image_size: Union[int, None] = None):
+        """
+        :param blocks: (compressed offset, compressed length) of every block
+        :param data_start: decompressed offset of the first block, what precedes it is stored as-is in `src`
+        :param doffs: decompressed offset of every block, None to find them out by decompressing
+        :param image_size: size of the decompressed image when `doffs` are known
+        """
+        self.src = src
+        self.blocks = blocks
+        self.data_start = data_start
+        self.decode_block = decode_block
+        self.jobs = jobs
+        self._doffs = list(doffs) if doffs is not None else []
+        self._known_end = image_size if doffs is not None else data_start
+        self._cache: Dict[int, bytearray] = {}
+        self._executor: Union[ThreadPoolExecutor, None] = None
+
+    @classmethod
+    def from_index(cls, src: mmap.mmap, index: BlockIndex, decode_block: BlockDecoder,
+                   jobs: int = 1) -> 'BlockImage':
+        data_start = index.blocks[0][2] if index.blocks else index.image_size
+        return cls(src, [(off, in_len) for off, in_len, _ in index.blocks], data_start, decode_block, jobs,
+                   [doff for _, _, doff in index.blocks], index.image_size)
+
+    def __enter__(self) -> 'BlockImage':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        if len(self._doffs) == len(self.blocks):
+            return self._known_end
+        # upper bound until the remaining blocks are decompressed
+        return self._known_end + BLOCK_SIZE * (len(self.blocks) - len(self._doffs))
+
+    def __getitem__(self, key: slice) -> Union[bytes, bytearray]:
+        self._discover(key.stop if key.stop is not None else sys.maxsize)
+        start, stop, _ = key.indices(len(self))
+        if start >= stop:
+            return b''
+        if stop <= self.data_start:
+            return self.src[start:stop]
+        parts = []
+        if start < self.data_start:
+            parts.append(self.src[start:self.data_start])
+            start = self.data_start
+        blocks = self.block_range(start, stop)
+        self._decode(blocks)
+        for i in blocks:
+            doff = self._doffs[i]
+            parts.append(self._cache[i][max(start - doff, 0):stop - doff])
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    def block_range(self, start: int, stop: int) -> range:
+        """
+        indices of the known blocks covering [start, stop) of the decompressed image
+        """
+        return range(max(bisect_right(self._doffs, start) - 1, 0), bisect_left(self._doffs, stop))
+
+    def block_table(self) -> List[Tuple[int, int, int]]:
+        """
+        (compressed offset, compressed length, decompressed offset) of the blocks whose offset is known
+        """
+        return [(off, in_len, doff) for (off, in_len), doff in zip(self.blocks, self._doffs)]
+
+    def prefetch(self, ranges: List[Tuple[int, int]]):
+        """
+        decompress the blocks covering every [start, stop) of `ranges` on `jobs` threads ahead of slicing them
+        """
+        if not ranges:
+            return
+        self._discover(max(stop for _, stop in ranges))
+        blocks = set()
+        for start, stop in ranges:
+            blocks.update(self.block_range(start, stop))
+        self._decode(sorted(blocks))
+
+    def _discover(self, stop: int):
+        """
+        decompress the blocks in order until the decompressed offset of the one holding `stop` is known. A block
+        decompresses to BLOCK_SIZE bytes at most, so the blocks up to `stop` - BLOCK_SIZE further are needed anyway and
+        decompressed together, no block past `stop` is.
+        """
+        while self._known_end < stop and len(self._doffs) < len(self.blocks):
+            needed = -(-(stop - self._known_end) // BLOCK_SIZE)
+            batch = range(len(self._doffs), min(len(self._doffs) + needed, len(self.blocks)))
+            self._decode(batch)
+            for i in batch:
+                self._doffs.append(self._known_end)
+                self._known_end += len(self._cache[i])
+
+    def _decode(self, blocks: Iterable[int]):
+        missing = [i for i in blocks if i not in self._cache]
+        if not missing:
+            return
+        if len(missing) > 1 and self.jobs > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+            results = self._executor.map(self._decode_block, missing)
+        else:
+            results = map(self._decode_block, missing)
+        for i, data in zip(missing, results):
+            self._cache[i] = data
+
+    def _decode_block(self, i: int) -> bytearray:
+        """
+        block `i` decompressed into a bytearray of its own, which the cache keeps as it is
+        """
+        off, in_len = self.blocks[i]
+        data = bytearray(BLOCK_SIZE)
+        out_buf = (c_char * BLOCK_SIZE).from_buffer(data)
+        status, out_len = self.decode_block(self.src[off:off + in_len], in_len, out_buf)
+        del out_buf
+        if status != 0:
+            raise OSError(errno.EIO, f'decompress failed, {status=} @0x{off - 2:x}')
+        del data[out_len:]
+        return data
+
+
+def parse_image_header(buf: Union[memoryview, bytes]) -> struct_image_header:
+    """
+    struct_image_header at the start of `buf`, decoded in the byte order its flags tell
+    :raise IFSFormatError: `buf` ends before the end of the header
+    """
+    if len(buf) < sizeof(struct_image_header):
+        raise IFSFormatError(f'image header truncated to {len(buf)} bytes')
+    if buf[struct_image_header.flags.offset] & IMAGE_FLAGS_BIGENDIAN:
+        return struct_image_header_be.from_buffer_copy(buf)
+    return struct_image_header.from_buffer_copy(buf)
+
+
+class IFSFormatError(ValueError):
+    pass
+
+
+class Dirent(NamedTuple):
+    attr: struct_image_attr
+    path: str
+    offset: int = 0  # S_IFREG: offset of the file from the image header
+    size: int = 0  # S_IFREG: size of the file, S_IFLNK: sym_size
+    target: str = ''  # S_IFLNK
+    dev: int = 0
+    rdev: int = 0
+
+    @property
+    def mode(self) -> int:
+        return self.attr.mode & S_IFMT
+
+
+class DirectoryTable:
+    """
+    image directory held column wise: an array per field of the dirents, and their paths and symlink targets packed
+    in two blobs, so a directory of 100k entries takes a few MB instead of a graph of Python objects per entry.
+    Indexing or iterating it builds the Dirent of an entry on demand. The columns support the buffer protocol, e.g.
+    numpy.frombuffer(table.size, numpy.uint32) sorts, filters or sums them without a copy.
+    """
+    COLUMNS = ('ino', 'mode', 'uid', 'gid', 'mtime', 'offset', 'size', 'dev', 'rdev')
+
+    def __init__(self):
+        self.ino = array('I')
+        self.mode = array('I')  # with the file type bits, S_IFMT
+        self.uid = array('I')
+        self.gid = array('I')
+        self.mtime = array('I')
+        self.offset = array('I')  # S_IFREG: offset of the file from the image header
+        self.size = array('I')  # S_IFREG: size of the file, S_IFLNK: sym_size
+        self.dev = array('I')
+        self.rdev = array('I')
+        self.paths = bytearray()
+        self.path_ends = array('Q')
+        self.targets = bytearray()  # S_IFLNK
+        self.target_ends = array('Q')
+
+    def append(self, ino: int, mode: int, uid: int, gid: int, mtime: int, path: bytes, offset: int = 0,
+               size: int = 0, target: bytes = b'', dev: int = 0, rdev: int = 0):
+        for column, value in zip(self.COLUMNS, (ino, mode, uid, gid, mtime, offset, size, dev, rdev)):
+            getattr(self, column).append(value)
+        self.paths += path
+        self.path_ends.append(len(self.paths))
+        self.targets += target
+        self.target_ends.append(len(self.targets))
+
+    def __len__(self) -> int:
+        return len(self.mode)
+
+    def __getitem__(self, i: int) -> Dirent:
+        attr = struct_image_attr(0, 0, self.ino[i], self.mode[i], self.gid[i], self.uid[i], self.mtime[i])
+        return Dirent(attr, self.path(i), self.offset[i], self.size[i], self.target(i), self.dev[i], self.rdev[i])
+
+    def __iter__(self) -> Iterator[Dirent]:
+        return (self[i] for i in range(len(self)))
+
+    def path(self, i: int) -> str:
+        return self.paths[self.path_ends[i - 1] if i else 0:self.path_ends[i]].decode('utf-8', 'surrogateescape')
+
+    def target(self, i: int) -> str:
+        return self.targets[self.target_ends[i - 1] if i else 0:self.target_ends[i]].decode('utf-8',
+                                                                                            'surrogateescape')
+
+    def take(self, indices: Iterable[int]) -> 'DirectoryTable':
+        """
+        table of the entries at `indices`, in that order
+        """
+        table = DirectoryTable()
+        for i in indices:
+            table.append(self.ino[i], self.mode[i], self.uid[i], self.gid[i], self.mtime[i],
+                         self.paths[self.path_ends[i - 1] if i else 0:self.path_ends[i]], self.offset[i],
+                         self.size[i], self.targets[self.target_ends[i - 1] if i else 0:self.target_ends[i]],
+                         self.dev[i], self.rdev[i])
+        return table
+
+    def select(self, selector: Callable[[str], bool]) -> 'DirectoryTable':
+        return self.take(i for i in range(len(self)) if selector(self.path(i)))
+
+    def files(self) -> List[int]:
+        """
+        indices of the S_IFREG entries
+        """
+        return [i for i, mode in enumerate(self.mode) if mode & S_IFMT == S_IFREG]
+
+    def file_ranges(self, ipos: int) -> List[Tuple[int, int]]:
+        """
+        [start, stop) of the S_IFREG entries in the image
+        """
+        return [(ipos + self.offset[i], ipos + self.offset[i] + self.size[i]) for i in self.files()]
+
+
+def read_image_header(image: Union[memoryview, 'BlockImage', 'StreamingImage'],
+                      shdr: Union[struct_startup_header, None], spos: int, ipos: int) \
+        -> Tuple[int, int, Union[struct_image_header, None]]:
+    """
+    :param ipos: pos of struct_image_header, -1 to search it after the startup
+    :return: errno, ipos, ihdr in host byte order
+    """
+    if ipos == -1:
+        start = spos + shdr.startup_size
+        # the image header normally follows the startup right away, only look further when it doesn't
+        image_header_re = re.compile(image_header_pattern)
+        match = image_header_re.search(image[start:start + BLOCK_SIZE]) or image_header_re.search(image[start:])
+        if match is None:
+            logger.warning(f'Failed to find image header after startup @0x{start:x}')
+            return errno.EINVAL, -1, None
+        ipos = start + match.start()
+    buf = image[ipos:ipos + sizeof(struct_image_header)]
+    try:
+        ihdr = parse_image_header(buf)
+    except IFSFormatError as ex:
+        logger.warning(f'{ex} @0x{ipos:x}')
+        return errno.EINVAL, -1, None
+    finally:
+        # a view of `image` left alive would keep the caller from releasing it
+        if isinstance(buf, memoryview):
+            buf.release()
+    return 0, ipos, ihdr
+
+
+def parse_directory(image: Union[memoryview, 'BlockImage', 'StreamingImage'], ihdr: struct_image_header,
+                    ipos: int) \
+        -> DirectoryTable:
+    """
+    every dirent of the image directory, in their order in the image, parsed in one pass over the directory region
+    :raise IFSFormatError:
+    """
+    dpos = ipos + ihdr.dir_offset
+    # slicing past the end of the image stops at it, a StreamingImage does not know its length before the end
+    dir_end = ipos + ihdr.hdr_dir_size
+    if isinstance(image, BlockImage):
+        image.prefetch([(dpos, dir_end)])
+    attr_codec, pair_codec, short_pair_codec = DIRENT_CODECS['>' if ihdr.flags & IMAGE_FLAGS_BIGENDIAN else '<']
+    unpack_attr, unpack_pair, unpack_short_pair = \
+        attr_codec.unpack_from, pair_codec.unpack_from, short_pair_codec.unpack_from
+    attr_size = sizeof(struct_image_attr)
+    # the whole region at once, the dirents are parsed out of it in place
+    region = bytes(image[dpos:dir_end])
+    table = DirectoryTable()
+    pos = 0
+    while pos + attr_size <= len(region):
+        size, _, ino, mode, gid, uid, mtime = unpack_attr(region, pos)
+        if size == 0:
+            break
+        if size < attr_size:
+            raise IFSFormatError(f'Invalid dir entry @0x{dpos + pos:x}')
+        if pos + size > len(region):
+            raise IFSFormatError(f'Error reading dir_ent @0x{dpos + pos:x}')
+        tail = pos + attr_size
+        end = pos + size
+        pos = end
+
+        attrmode = mode & S_IFMT
+        if attrmode == S_IFREG:
+            offset, file_size = unpack_pair(region, tail)
+            table.append(ino, mode, uid, gid, mtime, cstr(region, tail + 8, end), offset, file_size)
+        elif attrmode == S_IFDIR:
+            table.append(ino, mode, uid, gid, mtime, cstr(region, tail, end))
+        elif attrmode == S_IFLNK:
+            sym_offset, sym_size = unpack_short_pair(region, tail)
+            table.append(ino, mode, uid, gid, mtime, cstr(region, tail + 4, end), size=sym_size,
+                         target=cstr(region, tail + 4 + sym_offset, end))
+        else:
+            dev, rdev = unpack_pair(region, tail)
+            table.append(ino, mode, uid, gid, mtime, cstr(region, tail + 8, end), dev=dev, rdev=rdev)
+    return table
+
+
+def cstr(buf: bytes, start: int, end: int) -> bytes:
+    """
+    null terminated string at `start` of `buf`, up to `end` without terminator
+    """
+    stop = buf.find(b'\x00', start, end)
+    return buf[start:stop if stop != -1 else end]
+
+
+def process_image(image: Union[memoryview, 'BlockImage', 'StreamingImage'], outputdir: Path,
+                  shdr: Union[struct_startup_header, None], spos: int, ihdr: Union[struct_image_header, None],
+                  ipos: int,
+                  selector: Union[Callable[[str], bool], None] = None,
+                  stats: Union[Dict[str, int], None] = None, store: Union['BlobStore', None] = None,
+                  manifest: Union['Manifest', None] = None, writers: int = 1) -> int:
+    """
+    parse the image directory and extract the entries straight out of `image`, every dirent and file body is
+    a slice of it, so nothing is read or copied through intermediate bytes objects. The tree is materialized in three
+    phases: every directory is created once, then the files and symlinks are written into them, and only then the
+    modes and the directory mtimes are set, so that nothing written afterwards clobbers them.
+    :param image: whole not compressed or decompressed IFS file, or a BlockImage decompressing on demand
+    :param outputdir:
+    :param shdr:
+    :param spos: pos of struct_startup_header
+    :param ihdr: None to parse it at `ipos`
+    :param ipos: pos of struct_image_header, -1 to search it after the startup
+    :param selector: extract only the dirent paths it selects
+    :param stats: when not None, the 'entries', 'files' and 'bytes_out' counts of what is extracted are added to it
+    :param store: hardlink the extracted files to their blobs in it instead of writing copies
+    :param manifest: record the extracted entries in it, and leave alone the files it has unchanged
+    :param writers: threads writing the files while the directory is walked, see FileWriter
+    :return:
+    """
+    if ihdr is None:
+        res, ipos, ihdr = read_image_header(image, shdr, spos, ipos)
+        if res != 0:
+            return res
+    display_image_header(shdr, spos, ihdr, ipos)
+
+    try:
+        dirents = parse_directory(image, ihdr, ipos)
+    except IFSFormatError as ex:
+        logger.warning(f'{ex}')
+        return errno.EINVAL
+    if selector is not None:
+        dirents = dirents.select(selector)
+    if stats is not None:
+        files = dirents.files()
+        stats['entries'] = stats.get('entries', 0) + len(dirents)
+        stats['files'] = stats.get('files', 0) + len(files)
+        stats['bytes_out'] = stats.get('bytes_out', 0) + sum(dirents.size[i] for i in files)
+    if isinstance(image, BlockImage):
+        image.prefetch(dirents.file_ranges(ipos))
+
+    create_dirs(outputdir, dirents)
+    try:
+        with FileWriter(writers) as writer:
+            res = process_dirents(image, outputdir, ipos, dirents, store, manifest, writer)
+    except Exception as ex:
+        # the frames of the traceback hold slices of `image`, which would keep the caller from releasing it
+        import traceback
+        traceback.clear_frames(ex.__traceback__)
+        raise
+    # the files of the store are hardlinks to its read only blobs
+    set_attributes(outputdir, dirents, file_modes=store is None)
+    return res
+
+
+def create_dirs(outputdir: Path, dirents: DirectoryTable):
+    """
+    create, once and parents first, every directory of the dirents and every parent of the files and symlinks,
+    whether the image has a dirent for it or not
+    """
+    paths = set()
+    for i, mode in enumerate(dirents.mode):
+        if mode & S_IFMT not in (S_IFDIR, S_IFREG, S_IFLNK):
+            continue
+        path = dirents.path(i) if mode & S_IFMT == S_IFDIR else posixpath.dirname(dirents.path(i))
+        while path and path not in paths:
+            paths.add(path)
+            path = posixpath.dirname(path)
+    outputdir.mkdir(parents=True, exist_ok=True)
+    # a parent sorts before its children
+    for path in sorted(paths):
+        dir_path = outputdir / path
+        try:
+            os.mkdir(dir_path)
+        except FileExistsError:
+            # left by a previous run into the same directory
+            if dir_path.is_symlink() or not dir_path.is_dir():
+                shutil_rm(dir_path)
+                os.mkdir(dir_path)
+            else:
+                # u+rwx over the mode of its image, which set_attributes() restores once the files are written
+                os.chmod(dir_path, os.stat(dir_path).st_mode & 0o7777 | 0o700)
+
+
+def set_attributes(outputdir: Path, dirents: DirectoryTable, file_modes: bool = True):
+    """
+    once the content of the tree is written, set the mode of the files and the mode and mtime of the directories in a
+    single pass, deepest first, so that a directory losing its write or search permission has nothing left to change
+    inside. This process created them all, so no privilege is needed, their owner is left as it is.
+    :param file_modes: False to leave the mode of the files alone
+    """
+    follow_symlinks = os.chmod not in os.supports_follow_symlinks
+    entries = [(dirents.path(i), mode, dirents.mtime[i]) for i, mode in enumerate(dirents.mode)
+               if mode & S_IFMT == S_IFDIR or (file_modes and mode & S_IFMT == S_IFREG)]
+    for path, mode, mtime in sorted(entries, key=lambda _: _[0].count('/'), reverse=True):
+        if not path:
+            continue
+        if mode & S_IFMT == S_IFREG:
+            try:
+                os.chmod(outputdir / path, mode & 0o7777, follow_symlinks=follow_symlinks)
+            except FileNotFoundError:
+                # not written, the extraction failed before it
+                pass
+            continue
+        os.chmod(outputdir / path, mode & 0o7777, follow_symlinks=follow_symlinks)
+        os.utime(outputdir / path, (mtime, mtime), follow_symlinks=False)
+
+
+def display_image_header(shdr: Union[struct_startup_header, None], spos: int, ihdr: struct_image_header, ipos: int):
+    dpos = ipos + ihdr.dir_offset
+    print("   Offset     Size  Name")
+    if spos != -1:
+        if spos != 0:
+            print(f' {0:x} {spos:x}  "*.boot"')
+        display_shdr(spos, shdr)
+        print(f' {spos + sizeof(shdr):x} {shdr.startup_size - sizeof(shdr):x}  startup.*')
+    display_ihdr(ipos, ihdr)
+    print(f' {dpos:x} {ihdr.hdr_dir_size - ihdr.dir_offset:x} Image-directory')
+
+
+def process_dirents(image: Union[memoryview, 'BlockImage', 'StreamingImage'], outputdir: Path, ipos: int,
+                    dirents: DirectoryTable, store: Union['BlobStore', None], manifest: Union['Manifest', None],
+                    writer: 'FileWriter') -> int:
+    # the views of a FileMap all start at offset 0 of its file
+    src_fd = image.obj.fd if isinstance(image, memoryview) and isinstance(image.obj, FileMap) else None
+    for dirent in dirents:
+        attr = dirent.attr
+        attrmode = dirent.mode
+        if attrmode == S_IFREG:
+            # sliced here, a BlockImage is not shared with the writer threads
+            data = image[ipos + dirent.offset:ipos + dirent.offset + dirent.size]
+            # cut short at the end of the image
+            if len(data) < dirent.size:
+                logger.warning(f'{dirent.path=} is out of image, {dirent.offset=:x} {dirent.size=:x}')
+                return errno.EINVAL
+            writer.submit(len(data), process_file, data, outputdir, ipos, attr, dirent.offset, dirent.size,
+                          dirent.path, store, manifest, src_fd)
+
+        elif attrmode == S_IFDIR:
+            if manifest is not None and dirent.path:
+                manifest.add(outputdir / dirent.path, {'type': 'dir', 'mtime': attr.mtime})
+
+        elif attrmode == S_IFLNK:
+            process_symlink(outputdir, attr, dirent.path, dirent.target)
+            if manifest is not None:
+                manifest.add(outputdir / dirent.path, {'type': 'symlink', 'target': dirent.target, 'mtime': attr.mtime})
+        display_dirent(ipos, dirent)
+
+    return 0
+
+
+def display_dirent(ipos: int, dirent: Dirent):
+    attrmode = dirent.mode
+    if attrmode == S_IFREG:
+        display_file(ipos, dirent.offset, dirent.size, dirent.path)
+    elif attrmode == S_IFDIR:
+        display_dir(dirent.path)
+    elif attrmode == S_IFLNK:
+        display_symlink(dirent.size, dirent.path, dirent.target)
+    else:
+        if attrmode == S_IFCHR:
+            attr_str = 'S_IFCHR'
+        elif attrmode == S_IFBLK:
+            attr_str = 'S_IFBLK'
+        elif attrmode == S_IFIFO:
+            attr_str = 'S_IFIFO'
+        else:
+            attr_str = f'{attrmode:#o}'
+        display_device(dirent.path, dirent.dev, dirent.rdev, attr_str)
+
+
+def display_stats(dirents: DirectoryTable):
+    counts = {}
+    for mode in dirents.mode:
+        counts[mode & S_IFMT] = counts.get(mode & S_IFMT, 0) + 1
+    names = {S_IFDIR: 'directories', S_IFREG: 'files', S_IFLNK: 'symlinks', S_IFCHR: 'S_IFCHR', S_IFBLK: 'S_IFBLK',
+             S_IFIFO: 'S_IFIFO'}
+    # the types named above first, in their order
+    modes = [mode for mode in names if mode in counts] + sorted(mode for mode in counts if mode not in names)
+    print(f'{len(dirents)} entries' + ''.join(f', {counts[mode]} {names.get(mode, f"{mode:#o}")}' for mode in modes))
+    files = dirents.files()
+    if files:
+        largest = max(files, key=lambda i: dirents.size[i])
+        print(f'files: {sum(dirents.size[i] for i in files)} bytes, largest {dirents.size[largest]} bytes '
+              f'{dirents.path(largest)}')
+
+
+def display_file(ipos: int, offset: int, size: int, path: str) -> None:
+    print(f' {ipos + offset:8x} {size:8x}  {path}')
+
+
+def process_file(data: Union[memoryview, bytes], outputdir: Path, ipos: int, attr: struct_image_attr, offset: int,
+                 size: int, path: str, store: Union['BlobStore', None] = None, manifest: Union['Manifest', None] = None,
+                 src_fd: Union[int, None] = None):
+    """
+    :param data: body of the file, the `size` bytes at `ipos` + `offset` of the image
+    :param src_fd: file the image is mapped from, the body is then copied from it in the kernel
+    """
+    filePath = outputdir / Path(path)
+    digest = None
+    if store is not None or manifest is not None:
+        import hashlib
+        digest = hashlib.sha256(data).hexdigest()
+    if manifest is not None:
+        entry = {'type': 'file', 'offset': ipos + offset, 'size': size, 'mtime': attr.mtime, 'sha256': digest}
+        if manifest.add(filePath, entry):
+            return
+        # never write through the hardlink of a blob, nor follow a symlink
+        if os.path.lexists(filePath):
+            shutil_rm(filePath)
+    if store is None or not store.link(data, filePath, attr.mtime, digest):
+        with open(filePath, 'wb', buffering=0) as fout:
+            if src_fd is None or not copy_in_kernel(src_fd, ipos + offset, size, fout.fileno()):
+                fout.write(data)
+        os.utime(filePath, (attr.mtime, attr.mtime))
+    if manifest is not None:
+        manifest.written(filePath)
+
+
+def copy_in_kernel(src_fd: int, offset: int, size: int, dst_fd: int) -> bool:
+    """
+    copy `size` bytes at `offset` of `src_fd` to the empty `dst_fd` with copy_file_range(), which may reflink them,
+    or else with sendfile()
+    :return: False when neither can copy between these files, `dst_fd` is left empty then
+    """
+    for name in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, name):
+            continue
+        copied = 0
+        try:
+            while copied < size:
+                if name == 'copy_file_range':
+                    n = os.copy_file_range(src_fd, dst_fd, size - copied, offset + copied, copied)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, offset + copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError as ex:
+            if ex.errno not in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF):
+                raise
+            logger.debug(f'{ex=} {name}() unable to copy')
+        if copied == size:
+            return True
+        os.ftruncate(dst_fd, 0)
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+    return False
+
+
+class FileWriter:
+    """
+    runs process_file() on a pool of `writers` threads, so that creating and writing the files overlaps with walking
+    the directory and with each other, with at most `budget` bytes of file bodies queued or being written. Once all
+    the files are written, the first error in submission order is raised and the others are logged, whatever the
+    order the threads failed in. A single writer writes each file as it is submitted.
+    """
+
+    def __init__(self, writers: int = 1, budget: int = WRITE_BUDGET):
+        self.budget = budget
+        self._executor = ThreadPoolExecutor(max_workers=writers, thread_name_prefix='writer') if writers > 1 else None
+        self._futures = []
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self) -> 'FileWriter':
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(raise_errors=exc_type is None)
+
+    def submit(self, size: int, fn: Callable, *args):
+        """
+        call fn(*args) on a writer thread, once fewer than `budget` bytes are in flight
+        :param size: bytes held by `args` until the call returns
+        """
+        if self._executor is None:
+            fn(*args)
+            return
+        with self._cond:
+            # a file larger than the whole budget still gets written, on its own
+            self._cond.wait_for(lambda: self._in_flight == 0 or self._in_flight + size <= self.budget)
+            self._in_flight += size
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._release(size))
+        self._futures.append(future)
+
+    def _release(self, size: int):
+        with self._cond:
+            self._in_flight -= size
+            self._cond.notify_all()
+
+    def close(self, raise_errors: bool = True):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        errors = [future.exception() for future in self._futures if future.exception() is not None]
+        self._futures = []
+        if not raise_errors:
+            return
+        for ex in errors[1:]:
+            logger.warning(f'{ex} while writing')
+        if errors:
+            raise errors[0]
+
+
+class BlobStore:
+    """
+    content addressed store of file bodies, each one in `root`/<sha256[:2]>/<sha256>. Extracted files are hardlinks
+    to their blob, so the files many images have in common take the disk of one. The hardlinks of a blob share its
+    inode, hence the mtime of the first file stored in it, and the blobs are read only so that editing one extracted
+    file does not change the others.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.bytes_stored = 0
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def link(self, data, file_path: Path, mtime: int, digest: Union[str, None] = None) -> bool:
+        """
+        hardlink `file_path` to the blob of `data`, storing the blob first when it is new. `data` is hashed in
+        memory, right before it is written, rather than read back.
+        :param digest: sha256 of `data` when the caller already has it
+        :return: False when the blob can not be linked from `file_path`, e.g. across file systems, the caller then
+                 writes a copy
+        """
+        if digest is None:
+            import hashlib
+            digest = hashlib.sha256(data).hexdigest()
+        blob = self.blob_path(digest)
+        if not blob.exists():
+            import tempfile
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=blob.parent, prefix=f'.{digest[:16]}', delete=False) as fout:
+                fout.write(data)
+            try:
+                os.chmod(fout.name, 0o444)
+                os.utime(fout.name, (mtime, mtime))
+                # concurrent extractions may store the same blob: the first link publishes it, unlike a rename that
+                # would replace the inode the others already linked their files to
+                os.link(fout.name, blob)
+                with self._lock:
+                    self.bytes_stored += len(data)
+            except FileExistsError:
+                logger.debug(f'{blob} stored meanwhile')
+            finally:
+                os.unlink(fout.name)
+        try:
+            os.link(blob, file_path)
+        except OSError as ex:
+            if ex.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+                raise
+            logger.debug(f'{ex=} unable to link {file_path} to {blob}')
+            return False
+        return True
+
+
+class Manifest:
+    """
+    entries an extraction wrote into its output directory, saved in `root`/MANIFEST_NAME so the next --incremental
+    run over the same directory leaves alone the files whose content did not change
+    """
+    VERSION = 1
+
+    def __init__(self, root: Path, previous: Union[Dict[str, dict], None] = None):
+        """
+        :param root: output directory, the entries are keyed by their path relative to it
+        :param previous: entries of the previous run
+        """
+        self.root = root
+        self.previous = previous or {}
+        self.entries: Dict[str, dict] = {}
+        self.unchanged = 0
+        self.removed = 0
+        self.not_removed = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, root: Path) -> 'Manifest':
+        import json
+        try:
+            with (root / MANIFEST_NAME).open('r') as fin:
+                obj = json.load(fin)
+            if obj['version'] != cls.VERSION:
+                raise ValueError(f'unsupported manifest version {obj["version"]}')
+            return cls(root, obj['entries'])
+        except FileNotFoundError:
+            return cls(root)
+        except (OSError, ValueError, KeyError, TypeError) as ex:
+            logger.warning(f'{ex=} while loading the manifest of {root}, rewriting every entry')
+            return cls(root)
+
+    def add(self, path: Path, entry: dict) -> bool:
+        """
+        record the entry extracted at `path`
+        :return: True when it is a file the previous run wrote with the same content and mtime, and that is still
+                 there as it was written, see written()
+        """
+        key = path.relative_to(self.root).as_posix()
+        self.entries[key] = entry
+        previous = self.previous.get(key)
+        # files moving around in the image are still unchanged
+        if entry['type'] != 'file' or previous is None \
+                or any(previous.get(_) != entry[_] for _ in ('type', 'size', 'mtime', 'sha256')):
+            return False
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return False
+        if (st.st_mode & S_IFMT) != S_IFREG or previous.get('stat') != [st.st_ino, st.st_size, st.st_mtime_ns]:
+            return False
+        entry['stat'] = previous['stat']
+        with self._lock:
+            self.unchanged += 1
+        return True
+
+    def written(self, path: Path):
+        """
+        record the inode, size and mtime the file added at `path` was written with, a file replaced, edited or
+        touched since then is written again by the next run. Not its ctime, linking another file to the same
+        BlobStore blob changes that.
+        """
+        st = os.lstat(path)
+        with self._lock:
+            self.entries[path.relative_to(self.root).as_posix()]['stat'] = [st.st_ino, st.st_size, st.st_mtime_ns]
+
+    def finish(self, complete: bool = True) -> int:
+        """
+        remove the entries of the previous run that disappeared and save the manifest
+        :param complete: False when the extraction failed midway, the entries it did not reach are then kept
+        :return: errno of the first entry that could not be removed, it stays in the manifest for the next run to
+                 remove
+        """
+        res = 0
+        if complete:
+            # children before their parents, directories are only removed once empty as they may still hold
+            # entries the image has no dirent for
+            parents = set()
+            for key in sorted(self.previous.keys() - self.entries.keys(), reverse=True):
+                path = self.root / key
+                try:
+                    if self.previous[key]['type'] == 'dir' and not path.is_symlink():
+                        path.rmdir()
+                    else:
+                        path.unlink()
+                    self.removed += 1
+                    parents.add(posixpath.dirname(key))
+                except FileNotFoundError:
+                    pass
+                except OSError as ex:
+                    self.entries[key] = self.previous[key]
+                    if ex.errno in (errno.ENOTEMPTY, errno.EEXIST):
+                        logger.debug(f'{ex=} while removing {path}')
+                        continue
+                    logger.warning(f'{ex=} while removing {path}')
+                    self.not_removed += 1
+                    res = res or ex.errno or errno.EIO
+            # removing the entries touched their directories
+            for key in parents:
+                entry = self.entries.get(key)
+                if entry is not None and entry['type'] == 'dir':
+                    os.utime(self.root / key, (entry['mtime'], entry['mtime']), follow_symlinks=False)
+        else:
+            self.entries = {**self.previous, **self.entries}
+        logger.info(f'{self.root}: {self.unchanged} files unchanged, {self.removed} entries removed'
+                    + (f', {self.not_removed} not removed' if self.not_removed else ''))
+        self.save()
+        return res
+
+    def save(self):
+        import json
+        manifest_path = self.root / MANIFEST_NAME
+        tmp_path = manifest_path.with_name(manifest_path.name + '.tmp')
+        try:
+            with tmp_path.open('w') as fout:
+                json.dump({'version': self.VERSION, 'entries': self.entries}, fout)
+            os.replace(tmp_path, manifest_path)
+        except OSError as ex:
+            logger.warning(f'{ex=} while writing {manifest_path=}')
+
+
+def display_dir(path: str):
+    filename = 'Root-dirent' if not path else path
+    print(f'     ----     ----  {filename}')
+
+
+def process_symlink(outputdir: Path, attr: struct_image_attr, path: str, target: str):
+    filePath = outputdir / path
+    if target[0] == '/':
+        target_is_abs = True
+        sym_target = (outputdir / target[1:]).resolve()
+    else:
+        target_is_abs = False
+        sym_target = (outputdir / filePath / target).resolve()
+
+    if not sym_target.is_absolute():
+        target_abspath = (filePath.parent / sym_target).resolve()
+        if not target_abspath.exists():
+            logger.debug(f'{target_abspath=} not exist')
+    else:
+        if not sym_target.exists():
+            logger.debug(f'{sym_target} not exists')
+    if filePath.is_symlink() or filePath.exists():
+        shutil_rm(filePath)
+    try:
+        filePath.symlink_to(target)
+    except Exception as ex:
+        logger.warning('ex=%s, type(ex)=%s, filePath=%s, target=%s', ex, type(ex), filePath, target)
+    try:
+        os.utime(filePath, (attr.mtime, attr.mtime), follow_symlinks=False)
+    except FileNotFoundError:
+        pass
+    except PermissionError:
+        pass
+    # res = run_v1(f'sudo chmod {attr.mode & 0o7777:03o} {filePath}')
+    # if res.returncode != 0:
+    #    logger.debug(f'res.stderr=\n{res.stderr}')
+
+
+def display_symlink(sym_size: int, path: str, target: str):
+    print(f'     ---- {sym_size:8x}  {path} -> {target}')
+
+
+def display_device(dev_path: str, dev: int, rdev: int, attr_str: str):
+    print(f'     ----     ----  {dev_path} dev={dev} rdev={rdev} {attr_str}')
+
+
+def scan_headers(src: Union[mmap.mmap, bytes], start: int = 0, stop: Union[int, None] = None) \
+        -> Iterator[Tuple[str, int]]:
+    """
+    walk `src` once, window by window, and yield ('startup', spos) and ('imagefs', ipos) of every startup header and
+    image header signature in offset order; stop iterating as soon as the wanted hit is found
+    """
+    stop = len(src) if stop is None else min(stop, len(src))
+    for win_start in range(start, stop, SCAN_WINDOW):
+        win_end = min(win_start + SCAN_WINDOW, stop)
+        hits = []
+        for kind, literal, regex in header_signatures:
+            # a hit starting in this window may run past its end
+            pos = src.find(literal, win_start, min(win_end + len(literal) - 1, stop))
+            while pos != -1:
+                if regex.match(src, pos, stop):
+                    hits.append((pos, kind))
+                pos = src.find(literal, pos + 1, min(win_end + len(literal) - 1, stop))
+        for pos, kind in sorted(hits):
+            yield kind, pos
+
+
+def locate_image(src: Union[mmap.mmap, bytes]) -> Tuple[int, int]:
+    """
+    :return: spos of the first startup header, or -1 and ipos of an image without startup (-1 when there is none)
+    """
+    first_ipos = -1
+    for kind, pos in scan_headers(src):
+        if kind == 'startup':
+            return pos, -1
+        if pos == 0:
+            return -1, 0
+        if first_ipos == -1:
+            first_ipos = pos
+    return -1, first_ipos
+
+
+def display_shdr(spos: int, hdr: struct_startup_header):
+    print(f' {spos:8x} {hdr.header_size:8x}  Startup-header flags1=0x{hdr.flags1:x} flags2=0x{hdr.flags2:x} '
+          f'paddr_bias=0x{hdr.paddr_bias:x}')
+
+
+def display_ihdr(ipos: int, hdr: struct_image_header):
+    print(f' {ipos:8x} {sizeof(hdr):8x}  Image-header')
+
@@ -0,0 +1,85 @@
+"""
+the startup.h / image.h definitions dumpifs reads, taken from the ctypesgen output in startup_image.py
+
+startup_image.py also sets up the ctypesgen library loader and every other struct of the headers at import time,
+this module only holds the structs and flags of an image, so that a run imports nothing it does not use.
+"""
+from ctypes import Structure, c_char, c_ubyte, c_uint, c_ushort
+
+STARTUP_HDR_SIGNATURE = 0x00ff7eeb
+STARTUP_HDR_FLAGS1_VIRTUAL = 0x01
+STARTUP_HDR_FLAGS1_BIGENDIAN = 0x02
+STARTUP_HDR_FLAGS1_COMPRESS_MASK = 0x1c
+STARTUP_HDR_FLAGS1_COMPRESS_SHIFT = 0x02
+STARTUP_HDR_FLAGS1_COMPRESS_NONE = 0x00
+STARTUP_HDR_FLAGS1_COMPRESS_ZLIB = 0x04
+STARTUP_HDR_FLAGS1_COMPRESS_LZO = 0x08
+STARTUP_HDR_FLAGS1_COMPRESS_UCL = 0x0c
+
+IMAGE_SIGNATURE = 'imagefs'
+IMAGE_FLAGS_BIGENDIAN = 0x01
+IMAGE_FLAGS_READONLY = 0x02
+IMAGE_FLAGS_INO_BITS = 0x04
+
+
+# /home/miki/dumpifs/sys/startup.h: 44
+class struct_startup_header(Structure):
+    _fields_ = [
+        ('signature', c_uint),
+        ('version', c_ushort),
+        ('flags1', c_ubyte),
+        ('flags2', c_ubyte),
+        ('header_size', c_ushort),
+        ('machine', c_ushort),
+        ('startup_vaddr', c_uint),
+        ('paddr_bias', c_uint),
+        ('image_paddr', c_uint),
+        ('ram_paddr', c_uint),
+        ('ram_size', c_uint),
+        ('startup_size', c_uint),
+        ('stored_size', c_uint),
+        ('imagefs_paddr', c_uint),
+        ('imagefs_size', c_uint),
+        ('preboot_size', c_ushort),
+        ('zero0', c_ushort),
+        ('zero', c_uint * int(3)),
+        ('info', c_uint * int(48)),
+    ]
+
+
+# /home/miki/dumpifs/sys/image.h: 32
+class struct_image_header(Structure):
+    _fields_ = [
+        ('signature', c_char * int(7)),
+        ('flags', c_ubyte),
+        ('image_size', c_uint),
+        ('hdr_dir_size', c_uint),
+        ('dir_offset', c_uint),
+        ('boot_ino', c_uint * int(4)),
+        ('script_ino', c_uint),
+        ('chain_paddr', c_uint),
+        ('spare', c_uint * int(10)),
+        ('mountflags', c_uint),
+        ('mountpoint', c_char * int(1)),
+    ]
+
+
+# /home/miki/dumpifs/sys/image.h: 64
+class struct_image_attr(Structure):
+    _fields_ = [
+        ('size', c_ushort),
+        ('extattr_offset', c_ushort),
+        ('ino', c_uint),
+        ('mode', c_uint),
+        ('gid', c_uint),
+        ('uid', c_uint),
+        ('mtime', c_uint),
+    ]
+
+
+# /home/miki/dumpifs/sys/image.h: 98
+class struct_image_trailer(Structure):
+    _fields_ = [
+        ('cksum', c_uint),
+    ]
+
@@ -0,0 +1,128 @@
+"""
+NRV2B_8 decoder of UCL, the block compression of QNX IFS images, for hosts without libucl.
+
+It follows ucl_nrv2b_decompress_safe_8() of UCL n2b_d.c. When numba is installed the decoder is compiled, and it then
+releases the GIL so that the blocks of an image decode in parallel threads.
+"""
+from typing import Tuple
+
+try:
+    import numba
+    import numpy
+except ImportError:
+    numba = None
+
+UCL_E_OK = 0
+UCL_E_INPUT_OVERRUN = -201
+UCL_E_OUTPUT_OVERRUN = -202
+UCL_E_LOOKBEHIND_OVERRUN = -203
+UCL_E_INPUT_NOT_CONSUMED = -205
+
+
+def _getbit(bb: int, src, ilen: int) -> Tuple[int, int, int]:
+    """
+    next bit of the 8 bit buffer `bb`, refilled from `src` at `ilen` once its marker bit is shifted out
+    :return: bit, bb, ilen; bit is -1 when `src` is exhausted
+    """
+    if bb & 0x7f:
+        bb = (bb << 1) & 0x1ff
+    elif ilen < len(src):
+        bb = src[ilen] * 2 + 1
+        ilen += 1
+    else:
+        return -1, bb, ilen
+    return bb >> 8, bb, ilen
+
+
+def _decompress_into(src, dst) -> Tuple[int, int]:
+    ilen = 0
+    olen = 0
+    bb = 0
+    last_m_off = 1
+    while True:
+        bit, bb, ilen = _getbit(bb, src, ilen)
+        while bit == 1:
+            if ilen >= len(src):
+                return UCL_E_INPUT_OVERRUN, olen
+            if olen >= len(dst):
+                return UCL_E_OUTPUT_OVERRUN, olen
+            dst[olen] = src[ilen]
+            olen += 1
+            ilen += 1
+            bit, bb, ilen = _getbit(bb, src, ilen)
+        if bit < 0:
+            return UCL_E_INPUT_OVERRUN, olen
+
+        m_off = 1
+        while True:
+            bit, bb, ilen = _getbit(bb, src, ilen)
+            m_off = m_off * 2 + bit
+            bit, bb, ilen = _getbit(bb, src, ilen)
+            if bit < 0 or m_off > 0xffffff + 3:
+                return UCL_E_INPUT_OVERRUN if bit < 0 else UCL_E_LOOKBEHIND_OVERRUN, olen
+            if bit == 1:
+                break
+        if m_off == 2:
+            m_off = last_m_off
+        else:
+            if ilen >= len(src):
+                return UCL_E_INPUT_OVERRUN, olen
+            m_off = (m_off - 3) * 256 + src[ilen]
+            ilen += 1
+            if m_off == 0xffffffff:
+                break
+            m_off += 1
+            last_m_off = m_off
+
+        bit, bb, ilen = _getbit(bb, src, ilen)
+        m_len, bb, ilen = _getbit(bb, src, ilen)
+        m_len += bit * 2
+        if bit < 0 or m_len < 0:
+            return UCL_E_INPUT_OVERRUN, olen
+        if m_len == 0:
+            m_len = 1
+            while True:
+                bit, bb, ilen = _getbit(bb, src, ilen)
+                m_len = m_len * 2 + bit
+                bit, bb, ilen = _getbit(bb, src, ilen)
+                if bit < 0 or m_len < 0:
+                    return UCL_E_INPUT_OVERRUN, olen
+                if bit == 1:
+                    break
+            m_len += 2
+        if m_off > 0xd00:
+            m_len += 1
+
+        # the match copies m_len + 1 bytes, overlapping its own output when m_off is shorter than that
+        if m_off > olen:
+            return UCL_E_LOOKBEHIND_OVERRUN, olen
+        if olen + m_len + 1 > len(dst):
+            return UCL_E_OUTPUT_OVERRUN, olen
+        m_pos = olen - m_off
+        if m_off > m_len:
+            dst[olen:olen + m_len + 1] = dst[m_pos:m_pos + m_len + 1]
+            olen += m_len + 1
+        else:
+            for i in range(m_len + 1):
+                dst[olen] = dst[m_pos + i]
+                olen += 1
+
+    if ilen == len(src):
+        return UCL_E_OK, olen
+    return UCL_E_INPUT_NOT_CONSUMED if ilen < len(src) else UCL_E_INPUT_OVERRUN, olen
+
+
+if numba is not None:
+    _getbit = numba.njit(nogil=True, cache=True)(_getbit)
+    _decompress_into = numba.njit(nogil=True, cache=True)(_decompress_into)
+
+
+def decompress_into(src: bytes, dst) -> Tuple[int, int]:
+    """
+    decompress the NRV2B_8 block `src` into the writable buffer `dst`
+    :return: status as ucl_nrv2b_decompress_safe_8() returns it, and the decompressed length
+    """
+    if numba is not None:
+        return _decompress_into(numpy.frombuffer(src, numpy.uint8), numpy.frombuffer(dst, numpy.uint8))
+    with memoryview(dst) as view, view.cast('B') as out:
+        return _decompress_into(src, out)
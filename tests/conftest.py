@@ -0,0 +1,39 @@
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import dumpifs_core  # noqa: E402
+import ifs_builder  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_decoders(tmp_path_factory, monkeypatch):
+    """
+    every test picks its decoders afresh, with the autotune cache out of the home directory
+    """
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path_factory.mktemp('cache')))
+    dumpifs_core._decoders.clear()
+    yield
+    dumpifs_core._decoders.clear()
+
+
+@lru_cache(maxsize=None)
+def image_bytes(compression: str, e: str) -> bytes:
+    return ifs_builder.build(compression, ifs_builder.sample_entries(), e)
+
+
+@pytest.fixture
+def make_image(tmp_path):
+    """
+    write the sample image of a compression and byte order into `tmp_path`
+    """
+    def make(compression: str, e: str = '<', data: bytes = None) -> Path:
+        path = tmp_path / f'{compression}_{"be" if e == ">" else "le"}.ifs'
+        path.write_bytes(image_bytes(compression, e) if data is None else data)
+        return path
+
+    return make
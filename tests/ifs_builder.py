@@ -0,0 +1,210 @@
+"""
+synthetic QNX IFS images for the tests: a startup header and its startup code, followed by an image file system
+stored as-is, gzipped, or in LZO/UCL blocks, in either byte order
+"""
+import gzip
+import struct
+from typing import List, NamedTuple, Optional, Tuple
+
+BLOCK_SIZE = 0x8000
+STARTUP_SIZE = 0x400
+MTIME = 1600000000
+COMPRESSIONS = {'none': 0x00, 'zlib': 0x04, 'lzo': 0x08, 'ucl': 0x0c}
+
+
+class Entry(NamedTuple):
+    kind: str  # dir, file, symlink or chr
+    path: str
+    data: bytes = b''  # file: content, symlink: target
+    mode: int = 0  # permission bits, 0 for the usual ones of its kind
+
+
+def sample_entries() -> List[Entry]:
+    entries = [Entry('dir', ''), Entry('dir', 'proc'), Entry('dir', 'proc/boot'), Entry('dir', 'etc'),
+               Entry('symlink', 'usr/lib/ldqnx.so.2', b'/proc/boot/libc.so'), Entry('chr', 'dev/null')]
+    for i in range(12):
+        # compressible, and some of them spanning several blocks
+        size = 70000 + i * 1000 if i % 4 == 0 else 100 + i * 300
+        entries.append(Entry('file', f'proc/boot/f{i:02d}', bytes((j * (i + 1) // 7) & 0xff for j in range(size))))
+    entries.append(Entry('file', 'etc/empty'))
+    entries.append(Entry('file', 'proc/boot/.script', b'#script\nprocnto\n'))
+    return entries
+
+
+def pad4(data: bytes) -> bytes:
+    return data + b'\0' * (-len(data) % 4)
+
+
+def build_imagefs(entries: List[Entry], e: str = '<', chain: Optional[List[Entry]] = None) -> bytes:
+    """
+    image header, directory and file bodies
+    :param e: struct byte order
+    :param chain: entries of a second image file system following this one, which chain_paddr points to
+    """
+    hdr_size = 92
+    tails = []
+    for entry in entries:
+        path = entry.path.encode() + b'\0'
+        if entry.kind == 'file':
+            tails.append(pad4(b'\0' * 8 + path))  # offset and size patched below
+        elif entry.kind == 'dir':
+            tails.append(pad4(path))
+        elif entry.kind == 'symlink':
+            tails.append(pad4(struct.pack(e + '2H', len(path), len(entry.data)) + path + entry.data + b'\0'))
+        else:
+            tails.append(pad4(struct.pack(e + '2I', 5, 7) + path))
+    dir_size = sum(24 + len(tail) for tail in tails) + 4
+    data_start = hdr_size + dir_size + (-(hdr_size + dir_size) % 16)
+    body = b''
+    directory = b''
+    for ino, (entry, tail) in enumerate(zip(entries, tails), 1):
+        mode = {'dir': 0o040755, 'file': 0o100644, 'symlink': 0o120777, 'chr': 0o020666}[entry.kind]
+        if entry.mode:
+            mode = mode & 0o170000 | entry.mode
+        if entry.kind == 'file':
+            tail = struct.pack(e + '2I', data_start + len(body), len(entry.data)) + tail[8:]
+            body += entry.data + b'\0' * (-len(entry.data) % 16)
+        directory += struct.pack(e + '2H5I', 24 + len(tail), 0, ino, mode, 0, 0, MTIME + ino) + tail
+    directory += b'\0' * 4
+    image_size = data_start + len(body) + 4
+    hdr = b'imagefs' + bytes([1 if e == '>' else 0]) + struct.pack(e + '3I', image_size, hdr_size + dir_size, hdr_size)
+    hdr += b'\0' * 20 + struct.pack(e + 'I', image_size if chain else 0) + b'\0' * 40 + b'\0' * 8
+    image = hdr + directory
+    image += b'\0' * (data_start - len(image)) + body + struct.pack(e + 'I', 0)
+    return image + build_imagefs(chain, e) if chain else image
+
+
+def startup_header(flags1: int, stored_size: int, imagefs_size: int, e: str = '<') -> bytes:
+    hdr = struct.pack('<I', 0x00ff7eeb) + struct.pack(e + 'H', 1) + bytes([flags1, 0]) + struct.pack(e + '2H', 256, 3)
+    hdr += struct.pack(e + '7I', 0x1000, 0, 0x100000, 0x200000, 0x300000, STARTUP_SIZE, stored_size)
+    hdr += struct.pack(e + '2I', 0x400000, imagefs_size)
+    return hdr + b'\0' * (256 - len(hdr))
+
+
+def build(compression: str, entries: List[Entry], e: str = '<', prefix: bytes = b'\x11' * 0x200,
+          chain: Optional[List[Entry]] = None) -> bytes:
+    """
+    whole IFS file, `prefix` standing for the boot code in front of the startup header
+    :param compression: one of COMPRESSIONS
+    :param chain: entries of an image file system chained to the first one
+    """
+    imagefs = build_imagefs(entries, e, chain)
+    if compression == 'none':
+        stored = imagefs
+    elif compression == 'zlib':
+        stored = gzip.compress(imagefs)
+    else:
+        encode = lzo1x_literals if compression == 'lzo' else nrv2b_encode
+        stored = b''
+        for i in range(0, len(imagefs), BLOCK_SIZE):
+            block = encode(imagefs[i:i + BLOCK_SIZE])
+            stored += struct.pack('>H', len(block)) + block
+        stored += b'\0\0'
+    flags1 = COMPRESSIONS[compression] | (0x02 if e == '>' else 0)
+    shdr = startup_header(flags1, STARTUP_SIZE + len(stored) + 4, len(imagefs), e)
+    startup = shdr + bytes(i & 0xff for i in range(STARTUP_SIZE - len(shdr)))
+    return prefix + startup + stored + b'\0' * 4
+
+
+def lzo1x_literals(data: bytes) -> bytes:
+    """
+    LZO1X stream of `data` as a single literal run followed by the end of stream marker, valid for any decoder
+    """
+    if len(data) <= 238:
+        head = bytes([17 + len(data)])
+    else:
+        extra = len(data) - 18
+        zeros = (extra - 1) // 255
+        head = b'\0' + b'\0' * zeros + bytes([extra - 255 * zeros])
+    return head + data + b'\x11\0\0'
+
+
+class BitWriter:
+    """
+    NRV2B_8 bit stream: flag bytes interleaved with the literal and offset bytes, most significant bit first
+    """
+
+    def __init__(self):
+        self.out = bytearray()
+        self.flags_pos = -1
+        self.nbits = 8
+
+    def bit(self, bit: int):
+        if self.nbits == 8:
+            self.flags_pos = len(self.out)
+            self.out.append(0)
+            self.nbits = 0
+        self.out[self.flags_pos] |= (bit & 1) << (7 - self.nbits)
+        self.nbits += 1
+
+    def byte(self, value: int):
+        self.out.append(value)
+
+    def gamma(self, value: int):
+        bits = bin(value)[3:]
+        for i, bit in enumerate(bits):
+            self.bit(int(bit))
+            self.bit(1 if i == len(bits) - 1 else 0)
+
+
+def nrv2b_encode(data: bytes) -> bytes:
+    """
+    greedy NRV2B_8 compression of `data`, what ucl_nrv2b_decompress_safe_8() decodes
+    """
+    writer = BitWriter()
+    last: dict = {}
+    last_off = 1
+    i = 0
+    while i < len(data):
+        length, off = 0, 0
+        j = last.get(data[i:i + 3]) if i + 3 <= len(data) else None
+        if j is not None:
+            while i + length < len(data) and data[j + length] == data[i + length] and length < 0x1000:
+                length += 1
+            off = i - j
+            if length < 3 + (off > 0xd00):
+                length = 0
+        if length:
+            for k in range(i, min(i + length, len(data) - 2)):
+                last[data[k:k + 3]] = k
+            writer.bit(0)
+            if off == last_off:
+                writer.gamma(2)
+            else:
+                writer.gamma(((off - 1) >> 8) + 3)
+                writer.byte((off - 1) & 0xff)
+                last_off = off
+            k = length - 1 - (off > 0xd00)
+            if k <= 3:
+                writer.bit(k >> 1)
+                writer.bit(k & 1)
+            else:
+                writer.bit(0)
+                writer.bit(0)
+                writer.gamma(k - 2)
+            i += length
+        else:
+            if i + 3 <= len(data):
+                last[data[i:i + 3]] = i
+            writer.bit(1)
+            writer.byte(data[i])
+            i += 1
+    # end of stream: an offset of 0xffffffff
+    writer.bit(0)
+    writer.gamma(0x1000002)
+    writer.byte(0xff)
+    return bytes(writer.out)
+
+
+def block_offsets(ifs: bytes, prefix_size: int = 0x200) -> List[Tuple[int, int]]:
+    """
+    (offset, length) of the compressed blocks of an LZO/UCL file built by build()
+    """
+    blocks = []
+    pos = prefix_size + STARTUP_SIZE
+    while True:
+        length, = struct.unpack_from('>H', ifs, pos)
+        if length == 0:
+            return blocks
+        blocks.append((pos + 2, length))
+        pos += 2 + length
@@ -0,0 +1,761 @@
+import argparse
+import ctypes.util
+import errno
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import stat
+import struct
+import subprocess
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import dumpifs_core
+import ifs_builder
+import nrv2b
+import utils
+from conftest import image_bytes
+from ifs_builder import BLOCK_SIZE, COMPRESSIONS, MTIME, STARTUP_SIZE, Entry, block_offsets, nrv2b_encode, \
+    sample_entries
+
+BYTE_ORDERS = pytest.mark.parametrize('e', ['<', '>'], ids=['le', 'be'])
+PREFIX_SIZE = 0x200
+
+
+def require_decoder(compression: str):
+    if compression in ('lzo', 'ucl') and dumpifs_core.block_decoder(COMPRESSIONS[compression]) is None:
+        pytest.skip(f'no {compression} decoder on this host')
+
+
+def check_tree(outputdir, entries=None):
+    """
+    the extracted tree holds the sample entries, with their content and mtime
+    """
+    entries = sample_entries() if entries is None else entries
+    for ino, entry in enumerate(entries, 1):
+        path = outputdir / entry.path
+        if entry.kind == 'file':
+            assert path.read_bytes() == entry.data, entry.path
+            assert path.stat().st_mtime == MTIME + ino
+        elif entry.kind == 'dir':
+            assert path.is_dir()
+        elif entry.kind == 'symlink':
+            assert os.readlink(path) == entry.data.decode()
+
+
+def count_decoded_blocks(monkeypatch) -> list:
+    """
+    :return: list the compressed length of every block decoded from now on is appended to
+    """
+    decoded = []
+    select_block_decoder = dumpifs_core.block_decoder
+
+    def counting_block_decoder(cmpr_algo, samples=()):
+        decode_block = select_block_decoder(cmpr_algo, samples)
+
+        def decode(src, in_len, dst):
+            decoded.append(in_len)
+            return decode_block(src, in_len, dst)
+
+        return decode
+
+    monkeypatch.setattr(dumpifs_core, 'block_decoder', counting_block_decoder)
+    return decoded
+
+
+@BYTE_ORDERS
+@pytest.mark.parametrize('compression', list(COMPRESSIONS))
+def test_extract(make_image, tmp_path, capsys, compression, e):
+    require_decoder(compression)
+    assert dumpifs_core.process(make_image(compression, e), tmp_path / 'out') == 0
+    check_tree(tmp_path / 'out')
+    assert 'proc/boot/.script' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzo', 'ucl'])
+def test_extract_parallel_pipeline(make_image, tmp_path, compression):
+    require_decoder(compression)
+    assert dumpifs_core.process(make_image(compression), tmp_path / 'out', jobs=4, writers=4, pipeline=True) == 0
+    check_tree(tmp_path / 'out')
+
+
+def test_pipeline_decoder_raising(make_image, tmp_path, monkeypatch, caplog):
+    select_block_decoder = dumpifs_core.block_decoder
+    decoded = []
+
+    def failing_block_decoder(cmpr_algo, samples=()):
+        decode_block = select_block_decoder(cmpr_algo, samples)
+
+        def decode(src, in_len, dst):
+            decoded.append(in_len)
+            if len(decoded) == 4:
+                raise MemoryError('decoder out of memory')
+            return decode_block(src, in_len, dst)
+
+        return decode
+
+    require_decoder('ucl')
+    monkeypatch.setattr(dumpifs_core, 'block_decoder', failing_block_decoder)
+    res = []
+    # the extraction would wait forever for the rest of the image
+    extract = threading.Thread(target=lambda: res.append(
+        dumpifs_core.process(make_image('ucl'), tmp_path / 'out', pipeline=True)), daemon=True)
+    extract.start()
+    extract.join(30)
+    assert res == [errno.EIO]
+    assert 'MemoryError' in caplog.text and 'Traceback' in caplog.text
+
+
+def test_block_index(make_image, tmp_path, monkeypatch):
+    require_decoder('ucl')
+    ifs = make_image('ucl')
+    index_path = dumpifs_core.default_index_path(ifs)
+    assert dumpifs_core.process(ifs, tmp_path / 'out', index_path=index_path) == 0
+    index = dumpifs_core.load_block_index(index_path, ifs)
+    assert [off for off, _, _ in index.blocks] == [off for off, _ in block_offsets(image_bytes('ucl', '<'))]
+
+    # a matching index is used instead of scanning the blocks, and only the blocks of the selected file are decoded
+    def no_scan(*args):
+        raise AssertionError('blocks scanned despite the index')
+
+    monkeypatch.setattr(dumpifs_core, 'scan_blocks', no_scan)
+    out = io.BytesIO()
+    assert dumpifs_core.cat(ifs, 'proc/boot/f04', out, index_path=index_path) == 0
+    assert out.getvalue() == next(entry.data for entry in sample_entries() if entry.path == 'proc/boot/f04')
+    assert dumpifs_core.process(ifs, tmp_path / 'out2', index_path=index_path) == 0
+    check_tree(tmp_path / 'out2')
+
+
+def test_block_index_stale(make_image):
+    require_decoder('ucl')
+    ifs = make_image('ucl')
+    index_path = dumpifs_core.default_index_path(ifs)
+    assert dumpifs_core.cat(ifs, 'proc/boot/.script', io.BytesIO(), index_path=index_path) == 0
+    # touched only, the content still matches
+    os.utime(ifs, (MTIME, MTIME))
+    assert dumpifs_core.load_block_index(index_path, ifs) is not None
+    data = bytearray(image_bytes('ucl', '<'))
+    data[-1] ^= 1
+    ifs.write_bytes(data)
+    assert dumpifs_core.load_block_index(index_path, ifs) is None
+    index_path.write_text('{"version": 0}')
+    assert dumpifs_core.load_block_index(index_path, ifs) is None
+
+
+def test_modes_and_dir_mtimes(make_image, tmp_path):
+    modes = {'proc/boot': 0o750, 'etc': 0o555, 'proc/boot/f00': 0o755, 'proc/boot/f01': 0o600, 'etc/empty': 0o444}
+    entries = [entry._replace(mode=modes.get(entry.path, 0)) for entry in sample_entries()]
+    out = tmp_path / 'out'
+    assert dumpifs_core.process(make_image('none', data=ifs_builder.build('none', entries)), out, writers=4) == 0
+    check_tree(out, entries)
+    for ino, entry in enumerate(entries, 1):
+        if entry.path and entry.kind in ('dir', 'file'):
+            st = (out / entry.path).stat()
+            assert stat.S_IMODE(st.st_mode) == (entry.mode or (0o755 if entry.kind == 'dir' else 0o644)), entry.path
+            # writing the files into the directories did not clobber their mtime
+            assert st.st_mtime == MTIME + ino, entry.path
+
+
+NOBODY = 65534
+
+
+@pytest.fixture
+def nobody_dir(tmp_path):
+    """
+    directory an unprivileged user may write, see run_as_nobody()
+    """
+    if os.geteuid() != 0:
+        yield tmp_path
+        return
+    # out of the tmp_path of root, which only root may search
+    path = Path(tempfile.mkdtemp(prefix='dumpifs-'))
+    os.chown(path, NOBODY, NOBODY)
+    yield path
+    shutil.rmtree(path)
+
+
+def run_as_nobody(check) -> int:
+    """
+    :return: what `check` returns, called in a child process with the permissions of nobody when run as root
+    """
+    if os.geteuid() != 0:
+        return check()
+    pid = os.fork()
+    if pid == 0:
+        code = 255
+        try:
+            os.setgid(NOBODY)
+            os.setuid(NOBODY)
+            code = check()
+        finally:
+            os._exit(code)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
+def test_extract_again_over_read_only_modes(nobody_dir):
+    modes = {'etc': 0o555, 'etc/empty': 0o444}
+    entries = [entry._replace(mode=modes.get(entry.path, 0)) for entry in sample_entries()]
+    ifs = nobody_dir / 'a.ifs'
+    ifs.write_bytes(ifs_builder.build('none', entries))
+    changed = nobody_dir / 'b.ifs'
+    changed.write_bytes(ifs_builder.build('none', [entry._replace(data=b'changed') if entry.path == 'etc/empty'
+                                                   else entry for entry in entries]))
+    out = nobody_dir / 'out'
+
+    def extract() -> int:
+        # emptied the way main() does before extracting
+        for _ in range(2):
+            utils.rmtree_writable(out)
+            out.mkdir()
+            if dumpifs_core.process(ifs, out) != 0:
+                return 1
+        if dumpifs_core.process(ifs, out, incremental=True) != 0 \
+                or dumpifs_core.process(changed, out, incremental=True) != 0:
+            return 2
+        if (out / 'etc' / 'empty').read_bytes() != b'changed' or stat.S_IMODE((out / 'etc').stat().st_mode) != 0o555:
+            return 3
+        utils.rmtree_writable(out)
+        return 4 if out.exists() else 0
+
+    assert run_as_nobody(extract) == 0
+
+
+def test_copy_in_kernel_fallback(make_image, tmp_path, monkeypatch):
+    data = bytes(range(256)) * 64
+    (tmp_path / 'src').write_bytes(data)
+    copy_file_range = os.copy_file_range
+
+    def copy_once(src_fd, dst_fd, count, offset_src=None, offset_dst=None):
+        # copies a first chunk, then the file systems turn out to be unsupported
+        monkeypatch.setattr(os, 'copy_file_range', unsupported)
+        return copy_file_range(src_fd, dst_fd, min(count, 1000), offset_src, offset_dst)
+
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    monkeypatch.setattr(os, 'copy_file_range', copy_once)
+    with open(tmp_path / 'src', 'rb') as fin, open(tmp_path / 'dst', 'wb') as fout:
+        assert dumpifs_core.copy_in_kernel(fin.fileno(), 100, 5000, fout.fileno())
+    assert (tmp_path / 'dst').read_bytes() == data[100:5100]
+
+    monkeypatch.setattr(os, 'sendfile', unsupported)
+    with open(tmp_path / 'src', 'rb') as fin, open(tmp_path / 'dst', 'wb') as fout:
+        assert not dumpifs_core.copy_in_kernel(fin.fileno(), 100, 5000, fout.fileno())
+        assert fout.tell() == 0
+    assert (tmp_path / 'dst').read_bytes() == b''
+    # the bodies are then written from the map
+    assert dumpifs_core.process(make_image('none'), tmp_path / 'out') == 0
+    check_tree(tmp_path / 'out')
+
+
+@pytest.mark.parametrize('compression', ['none', 'ucl'])
+def test_extract_only(make_image, tmp_path, compression):
+    require_decoder(compression)
+    selector = dumpifs_core.path_selector(['proc/boot/f0*'], ['proc/boot/f01'])
+    assert dumpifs_core.process(make_image(compression), tmp_path / 'out', selector=selector) == 0
+    extracted = sorted(path.name for path in (tmp_path / 'out' / 'proc' / 'boot').iterdir())
+    assert extracted == [f'f0{i}' for i in range(10) if i != 1]
+    assert not (tmp_path / 'out' / 'etc' / 'empty').exists()
+
+
+def test_extract_all(tmp_path, capsys):
+    chained = [Entry('dir', ''), Entry('file', 'chained.txt', b'second image file system')]
+    first = ifs_builder.build('none', sample_entries(), chain=chained)
+    second = ifs_builder.build('zlib', sample_entries(), '>', prefix=b'\x22' * 0x40)
+    ifs = tmp_path / 'flash.bin'
+    ifs.write_bytes(first + second)
+    assert dumpifs_core.process_all(ifs, tmp_path / 'out', workers=2) == 0
+    check_tree(tmp_path / 'out' / f'ifs0_{PREFIX_SIZE:08x}')
+    assert (tmp_path / 'out' / f'ifs0_{PREFIX_SIZE:08x}' / 'chain1' / 'chained.txt').read_bytes() == chained[1].data
+    check_tree(tmp_path / 'out' / f'ifs1_{len(first) + 0x40:08x}')
+    out = capsys.readouterr().out
+    assert f'2 images in {ifs}' in out
+    assert 'chained image header @0x' in out
+
+
+def test_extract_all_only_decompresses_the_selected_files(make_image, tmp_path, monkeypatch):
+    require_decoder('ucl')
+    decoded = count_decoded_blocks(monkeypatch)
+    summary = dumpifs_core.extract_found_image(make_image('ucl'), None, tmp_path / 'out', only=['proc/boot/f00'])
+    assert summary['status'] == 0 and summary['files'] == 1
+    assert (tmp_path / 'out' / 'proc' / 'boot' / 'f00').read_bytes() == sample_entries()[6].data
+    assert len(decoded) < len(block_offsets(image_bytes('ucl', '<')))
+
+
+def test_batch(make_image, tmp_path):
+    require_decoder('ucl')
+    inputs = tmp_path / 'firmwares'
+    inputs.mkdir()
+    for compression in ('none', 'ucl'):
+        make_image(compression).rename(inputs / f'{compression}.ifs')
+    (inputs / 'broken.ifs').write_bytes(bytes(range(256)) * 16)
+    report = io.StringIO()
+    jobs = [(path, tmp_path / 'out' / path.name) for path in sorted(inputs.iterdir())]
+    # every worker picks its decoder, rather than inheriting the one require_decoder() picked
+    dumpifs_core._decoders.clear()
+    assert dumpifs_core.process_batch(jobs, report, workers=2) == errno.EINVAL
+    records = {Path(record['path']).name: record for record in map(json.loads, report.getvalue().splitlines())}
+    assert sorted(records) == ['broken.ifs', 'none.ifs', 'ucl.ifs']
+    for name in ('none.ifs', 'ucl.ifs'):
+        record = records[name]
+        assert record['status'] == 0 and record['errors'] == []
+        assert record['compression'] == name[:-4] and record['endian'] == 'little'
+        assert record['entries'] == 20 and record['files'] == 14
+        assert record['bytes_in'] == (inputs / name).stat().st_size
+        assert record['bytes_out'] == sum(len(entry.data) for entry in sample_entries() if entry.kind == 'file')
+        check_tree(tmp_path / 'out' / name)
+    assert records['broken.ifs']['status'] == errno.EINVAL and records['broken.ifs']['errors']
+
+
+def test_store(make_image, tmp_path):
+    require_decoder('ucl')
+    store = dumpifs_core.BlobStore(tmp_path / 'blobs')
+    assert dumpifs_core.process(make_image('none'), tmp_path / 'out1', store=store) == 0
+    stored = store.bytes_stored
+    assert stored == sum(len(entry.data) for entry in sample_entries() if entry.kind == 'file')
+    # the same files in another image are only linked
+    assert dumpifs_core.process(make_image('ucl'), tmp_path / 'out2', store=store, writers=4) == 0
+    assert store.bytes_stored == stored
+    check_tree(tmp_path / 'out1')
+    check_tree(tmp_path / 'out2')
+    for out in ('out1', 'out2'):
+        st = (tmp_path / out / 'proc' / 'boot' / 'f04').stat()
+        assert st.st_nlink == 3 and st.st_mode & 0o222 == 0
+    assert (tmp_path / 'out1' / 'proc' / 'boot' / 'f04').samefile(tmp_path / 'out2' / 'proc' / 'boot' / 'f04')
+
+
+def test_store_race(tmp_path, monkeypatch):
+    store = dumpifs_core.BlobStore(tmp_path / 'blobs')
+    assert store.link(b'body', tmp_path / 'a', MTIME)
+    blob = store.blob_path(hashlib.sha256(b'body').hexdigest())
+    # another writer storing the same blob, which it did not see yet
+    monkeypatch.setattr(Path, 'exists', lambda self: False)
+    assert store.link(b'body', tmp_path / 'b', MTIME)
+    monkeypatch.undo()
+    assert store.bytes_stored == 4
+    assert (tmp_path / 'a').samefile(blob) and (tmp_path / 'b').samefile(blob)
+    assert os.listdir(blob.parent) == [blob.name]
+
+
+def test_incremental(make_image, tmp_path, caplog):
+    out = tmp_path / 'out'
+    assert dumpifs_core.process(make_image('none'), out, incremental=True) == 0
+    inode = (out / 'proc' / 'boot' / 'f00').stat().st_ino
+    (out / 'proc' / 'boot' / 'f01').write_bytes(b'edited')
+    os.utime(out / 'proc' / 'boot' / 'f02', (MTIME, MTIME))
+    # the next version changes f05 and drops the .script
+    entries = [entry._replace(data=entry.data[::-1]) if entry.path == 'proc/boot/f05' else entry
+               for entry in sample_entries()[:-1]]
+    ifs = make_image('none', data=ifs_builder.build('none', entries))
+    with caplog.at_level(logging.INFO):
+        assert dumpifs_core.process(ifs, out, incremental=True) == 0
+    assert f'{out}: 10 files unchanged, 1 entries removed' in caplog.text
+    check_tree(out, entries)
+    assert (out / 'proc' / 'boot' / 'f00').stat().st_ino == inode
+    assert not (out / 'proc' / 'boot' / '.script').exists()
+    manifest = dumpifs_core.Manifest.load(out)
+    assert 'proc/boot/.script' not in manifest.previous and 'proc/boot/f05' in manifest.previous
+
+
+def test_incremental_entries_not_removed(nobody_dir):
+    entries = [entry._replace(mode=0o555) if entry.path == 'etc' else entry for entry in sample_entries()]
+    ifs = nobody_dir / 'a.ifs'
+    ifs.write_bytes(ifs_builder.build('none', entries))
+    # the next version drops etc along with the file in it
+    without_etc = nobody_dir / 'b.ifs'
+    without_etc.write_bytes(ifs_builder.build('none', [entry for entry in entries if not entry.path.startswith('etc')]))
+    out = nobody_dir / 'out'
+
+    def extract() -> int:
+        if dumpifs_core.process(ifs, out, incremental=True) != 0:
+            return 1
+        if dumpifs_core.process(without_etc, out, incremental=True) != errno.EACCES:
+            return 2
+        if not (out / 'etc' / 'empty').exists() or 'etc/empty' not in dumpifs_core.Manifest.load(out).previous:
+            return 3
+        # the next run retries what is still there
+        os.chmod(out / 'etc', 0o755)
+        if dumpifs_core.process(without_etc, out, incremental=True) != 0 or (out / 'etc').exists():
+            return 4
+        return 0 if 'etc/empty' not in dumpifs_core.Manifest.load(out).previous else 5
+
+    assert run_as_nobody(extract) == 0
+
+
+def test_file_writer_errors_in_submission_order(caplog):
+    failed = threading.Event()
+
+    def fail_last():
+        failed.wait(5)
+        raise ValueError('first submitted')
+
+    def fail_first():
+        try:
+            raise KeyError('second submitted')
+        finally:
+            failed.set()
+
+    with pytest.raises(ValueError, match='first submitted'):
+        with dumpifs_core.FileWriter(writers=2) as writer:
+            writer.submit(1, fail_last)
+            writer.submit(1, fail_first)
+    assert "'second submitted' while writing" in caplog.text
+
+
+def test_file_writer_budget():
+    lock = threading.Lock()
+    running = []
+    in_flight = []  # (size, bytes in flight) as each write starts
+
+    def write(size):
+        with lock:
+            running.append(size)
+            in_flight.append((size, sum(running)))
+        time.sleep(0.01)
+        with lock:
+            running.remove(size)
+
+    with dumpifs_core.FileWriter(writers=4, budget=10) as writer:
+        # the last one is larger than the whole budget
+        for size in (4, 4, 4, 4, 30):
+            writer.submit(size, write, size)
+    assert len(in_flight) == 5
+    assert all(total <= 10 for size, total in in_flight if size == 4)
+    # written on its own
+    assert (30, 30) in in_flight
+
+
+def test_archive_tar(make_image):
+    require_decoder('ucl')
+    out = io.BytesIO()
+    assert dumpifs_core.archive(out, make_image('ucl'), 'tar') == 0
+    out.seek(0)
+    with tarfile.open(fileobj=out) as tar:
+        members = {member.name: member for member in tar}
+        entries = [entry for entry in sample_entries() if entry.path]
+        assert sorted(members) == sorted(entry.path for entry in entries)
+        for ino, entry in enumerate(sample_entries(), 1):
+            if not entry.path:
+                continue
+            member = members[entry.path]
+            assert member.mtime == MTIME + ino
+            if entry.kind == 'file':
+                assert tar.extractfile(member).read() == entry.data and member.mode == 0o644
+            elif entry.kind == 'symlink':
+                assert member.issym() and member.linkname == entry.data.decode()
+            elif entry.kind == 'chr':
+                assert member.ischr() and (member.devmajor, member.devminor) == (0, 7)
+            else:
+                assert member.isdir() and member.mode == 0o755
+
+
+def test_archive_cpio(make_image):
+    out = io.BytesIO()
+    assert dumpifs_core.archive(out, make_image('none'), 'cpio') == 0
+    data = out.getvalue()
+    assert len(data) % 512 == 0
+    members = {}
+    pos = 0
+    while True:
+        assert data[pos:pos + 6] == b'070701'
+        fields = [int(data[pos + 6 + 8 * i:pos + 14 + 8 * i], 16) for i in range(13)]
+        mode, size, name_size = fields[1], fields[6], fields[11]
+        name = data[pos + 110:pos + 110 + name_size - 1].decode()
+        pos += 110 + name_size + (-(110 + name_size) % 4)
+        if name == 'TRAILER!!!':
+            break
+        members[name] = (mode, data[pos:pos + size])
+        pos += size + (-size % 4)
+    for entry in sample_entries():
+        if not entry.path:
+            continue
+        mode, body = members.pop(entry.path)
+        kind = {'dir': stat.S_IFDIR, 'file': stat.S_IFREG, 'symlink': stat.S_IFLNK, 'chr': stat.S_IFCHR}[entry.kind]
+        assert stat.S_IFMT(mode) == kind
+        if entry.kind in ('file', 'symlink'):
+            assert body == entry.data
+    assert not members
+
+
+def test_archive_corrupt_block(make_image, tmp_path, monkeypatch):
+    require_decoder('ucl')
+    monkeypatch.delenv('DUMPIFS_STARTUP_BUDGET_MS', raising=False)
+    data = bytearray(image_bytes('ucl', '<'))
+    offset, length = block_offsets(data)[1]
+    data[offset:offset + length] = b'\xff' * length
+    ifs = make_image('ucl', data=bytes(data))
+    archive = tmp_path / 'out.tar'
+    # --only reads the image through a lazy BlockImage
+    monkeypatch.setattr(sys, 'argv', ['dumpifs.py', str(ifs), '--format', 'tar', '-o', str(archive),
+                                      '--only', 'proc/boot'])
+    assert dumpifs_core.main() == errno.EIO
+    assert not archive.exists()
+    monkeypatch.setattr(sys, 'argv', ['dumpifs.py', str(ifs), '--format', 'tar', '-o', str(tmp_path / 'no' / 'x')])
+    assert dumpifs_core.main() == errno.ENOENT
+
+
+@BYTE_ORDERS
+def test_ifs_image(make_image, e):
+    require_decoder('ucl')
+    entries = {entry.path: entry for entry in sample_entries()}
+    with dumpifs_core.IFSImage(make_image('ucl', e)) as ifs:
+        assert sorted(ifs.listdir('/proc/boot')) == sorted(path.rsplit('/', 1)[1] for path in entries
+                                                           if path.startswith('proc/boot/'))
+        assert ifs.readlink('usr/lib/ldqnx.so.2') == '/proc/boot/libc.so'
+        assert ifs.stat('proc/boot/f04').st_size == len(entries['proc/boot/f04'].data)
+        with ifs.open('/proc/boot/f04') as fin:
+            fin.seek(BLOCK_SIZE - 10)
+            assert fin.read(20) == entries['proc/boot/f04'].data[BLOCK_SIZE - 10:BLOCK_SIZE + 10]
+        with pytest.raises(FileNotFoundError):
+            ifs.open('proc/boot/missing')
+
+
+def test_ifs_image_inflates_zlib_as_far_as_read(make_image, monkeypatch):
+    monkeypatch.setattr(dumpifs_core, 'STREAM_READAHEAD', 0x1000)
+    monkeypatch.setenv('DUMPIFS_ZLIB_CHUNK_KB', '1')
+    entries = {entry.path: entry for entry in sample_entries()}
+    with dumpifs_core.IFSImage(make_image('zlib')) as ifs:
+        assert isinstance(ifs.image, dumpifs_core.StreamingImage)
+        image_size = PREFIX_SIZE + STARTUP_SIZE + len(ifs_builder.build_imagefs(sample_entries()))
+        assert ifs.open('proc/boot/f01').read() == entries['proc/boot/f01'].data
+        f01 = ifs._dirent('proc/boot/f01')
+        end = ifs.ipos + f01.offset + f01.size
+        # up to the file, the readahead and the output of the last inflate call
+        assert end <= ifs.image.tell() <= end + 0x1000 + 4 * 1024 < image_size
+        assert ifs.open('proc/boot/.script').read() == entries['proc/boot/.script'].data
+        assert len(ifs.image) == image_size
+
+
+def test_cat(make_image):
+    require_decoder('ucl')
+    out = io.BytesIO()
+    assert dumpifs_core.cat(make_image('ucl'), '/proc/boot/.script', out) == 0
+    assert out.getvalue() == b'#script\nprocnto\n'
+
+
+@pytest.mark.parametrize('compression', list(COMPRESSIONS))
+def test_list(make_image, tmp_path, capsys, compression):
+    require_decoder(compression)
+    assert dumpifs_core.list_image(make_image(compression)) == 0
+    out = capsys.readouterr().out
+    assert '20 entries, 4 directories, 14 files, 1 symlinks, 1 S_IFCHR' in out
+    assert 'largest 78000 bytes proc/boot/f08' in out
+    assert list(tmp_path.iterdir()) == [tmp_path / f'{compression}_le.ifs']
+
+
+def test_list_decompresses_only_the_directory(make_image, monkeypatch):
+    require_decoder('ucl')
+    decoded = count_decoded_blocks(monkeypatch)
+    assert dumpifs_core.list_image(make_image('ucl')) == 0
+    # the image header is searched in the first 64 KiB
+    assert 0 < len(decoded) <= 2 < len(block_offsets(image_bytes('ucl', '<')))
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib', 'lzo', 'ucl'])
+def test_truncated(make_image, tmp_path, compression):
+    require_decoder(compression)
+    data = image_bytes(compression, '<')
+    ifs = make_image(compression, data=data[:len(data) // 2])
+    assert dumpifs_core.process(ifs, tmp_path / 'out') != 0
+    assert dumpifs_core.cat(ifs, 'proc/boot/f08', io.BytesIO()) != 0
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'ucl'])
+def test_truncated_ifs_image_read(make_image, compression):
+    require_decoder(compression)
+    data = image_bytes(compression, '<')
+    with dumpifs_core.IFSImage(make_image(compression, data=data[:len(data) // 2])) as ifs:
+        with pytest.raises((dumpifs_core.IFSFormatError, OSError)):
+            ifs.open('proc/boot/f08').read()
+
+
+@pytest.mark.parametrize('compression', ['lzo', 'ucl'])
+def test_corrupt_block(make_image, tmp_path, compression):
+    require_decoder(compression)
+    data = bytearray(image_bytes(compression, '<'))
+    offset, length = block_offsets(data)[1]
+    # an LZO instruction or NRV2B flag bits running past the end of the block
+    data[offset:offset + length] = b'\xff' * length
+    assert dumpifs_core.process(make_image(compression, data=bytes(data)), tmp_path / 'out') != 0
+
+
+def test_corrupt_zlib(make_image, tmp_path):
+    data = bytearray(image_bytes('zlib', '<'))
+    start = PREFIX_SIZE + STARTUP_SIZE + 100
+    data[start:start + 64] = b'\xa5' * 64
+    assert dumpifs_core.process(make_image('zlib', data=bytes(data)), tmp_path / 'out') != 0
+
+
+def test_truncated_zlib_stream(tmp_path):
+    stream = gzip.compress(bytes(range(256)) * 4096)
+    for data, res in ((stream, 0), (stream[:len(stream) // 2], errno.EIO)):
+        (tmp_path / 'stream.gz').write_bytes(data)
+        with open(tmp_path / 'stream.gz', 'rb') as fin, dumpifs_core.ImageBuffer() as buf:
+            assert dumpifs_core.decompress_zlib(fin, buf) == res
+
+
+@pytest.mark.parametrize('chunk_kb', ['1', '7', 'huge'])
+def test_zlib_chunk_size(make_image, tmp_path, monkeypatch, caplog, chunk_kb):
+    monkeypatch.delenv('DUMPIFS_ZLIB_CHUNK_KB', raising=False)
+    dumpifs_core.export_image_arguments(argparse.Namespace(library=[], zlib_chunk=None))
+    assert dumpifs_core.zlib_chunk_size() == dumpifs_core.ZLIB_CHUNK_SIZE
+    monkeypatch.setenv('DUMPIFS_ZLIB_CHUNK_KB', chunk_kb)
+    assert dumpifs_core.process(make_image('zlib'), tmp_path / 'out') == 0
+    check_tree(tmp_path / 'out')
+    if chunk_kb.isdigit():
+        assert dumpifs_core.zlib_chunk_size() == int(chunk_kb) * 1024
+    else:
+        assert "'huge' is not a positive number of KiB" in caplog.text
+    dumpifs_core.export_image_arguments(argparse.Namespace(library=[], zlib_chunk=64))
+    assert dumpifs_core.zlib_chunk_size() == 64 * 1024
+
+
+@BYTE_ORDERS
+def test_corrupt_dirent(make_image, tmp_path, e):
+    data = bytearray(image_bytes('none', e))
+    # size of the first dirent, shorter than its struct_image_attr
+    struct.pack_into(e + 'H', data, PREFIX_SIZE + STARTUP_SIZE + 92, 4)
+    assert dumpifs_core.process(make_image('none', e, bytes(data)), tmp_path / 'out') == errno.EINVAL
+
+
+@pytest.mark.parametrize('split', [1, 3, 7])
+def test_scan_headers_straddling_windows(monkeypatch, split):
+    window = 0x100
+    monkeypatch.setattr(dumpifs_core, 'SCAN_WINDOW', window)
+    startup = image_bytes('none', '<')[PREFIX_SIZE:PREFIX_SIZE + 64]
+    # a signature starting `split` bytes before the end of a window, the whole header running into the next ones
+    src = b'\x5a' * (window - split) + startup + b'\x5a' * (2 * window - 64) + b'imagefs\x00' + b'\x5a' * 32
+    assert list(dumpifs_core.scan_headers(src)) == [('startup', window - split), ('imagefs', 3 * window - split)]
+    assert dumpifs_core.locate_image(src) == (window - split, -1)
+
+
+def test_locate_image_across_windows(make_image, tmp_path, monkeypatch):
+    # the startup header signature straddles the end of the second window
+    monkeypatch.setattr(dumpifs_core, 'SCAN_WINDOW', PREFIX_SIZE // 2 + 2)
+    assert dumpifs_core.process(make_image('none'), tmp_path / 'out') == 0
+    check_tree(tmp_path / 'out')
+
+
+@pytest.mark.parametrize('data', [b'', bytes(range(256)) * 64], ids=['empty', 'no-image'])
+def test_not_an_image(make_image, tmp_path, data):
+    assert dumpifs_core.process(make_image('none', data=data), tmp_path / 'out') == errno.EINVAL
+
+
+@pytest.mark.parametrize('end', [8, 48, 512 + 100], ids=['imagefs', 'image-header', 'startup-header'])
+def test_truncated_header(make_image, tmp_path, end):
+    data = image_bytes('none', '<')
+    # the bare image file system, or the startup header at 0x200 with its image
+    data = data[data.index(b'imagefs'):][:end] if end < 512 else data[:end]
+    ifs = make_image('none', data=data)
+    assert dumpifs_core.process(ifs, tmp_path / 'out') == errno.EINVAL
+    assert dumpifs_core.list_image(ifs) == errno.EINVAL
+    assert dumpifs_core.archive(io.BytesIO(), ifs) == errno.EINVAL
+
+
+def test_library_override(make_image, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(dumpifs_core, '_libraries', {})
+    monkeypatch.delenv('DUMPIFS_LIBUCL', raising=False)
+    monkeypatch.delenv('DUMPIFS_LIBLZO2', raising=False)
+    assert dumpifs_core.library_path('lzo2=/opt/lzo/liblzo2.so') == ('lzo2', '/opt/lzo/liblzo2.so')
+    with pytest.raises(argparse.ArgumentTypeError):
+        dumpifs_core.library_path('zlib=/usr/lib/libz.so')
+    # an explicit path is loaded rather than looked up, a library without the functions is not taken
+    dumpifs_core.set_library_paths([('ucl', ctypes.util.find_library('c')), ('lzo2', str(tmp_path / 'missing.so'))])
+    monkeypatch.setattr(ctypes.util, 'find_library', lambda name: pytest.fail(f'lib{name} looked up'))
+    assert dumpifs_core.decompressor_library('ucl') is None
+    assert dumpifs_core.decompressor_library('lzo2') is None
+    assert 'unable to load libucl from' in caplog.text and 'unable to load liblzo2 from' in caplog.text
+    # the failures are remembered, the libraries are only loaded once per process
+    monkeypatch.setattr(dumpifs_core, 'load_decompressor_library', lambda name: pytest.fail(f'lib{name} reloaded'))
+    assert dumpifs_core.decompressor_library('ucl') is None
+    # UCL blocks are decoded by the fallback then
+    assert dumpifs_core.process(make_image('ucl'), tmp_path / 'out') == 0
+    check_tree(tmp_path / 'out')
+
+
+def test_decoder_autotune_cache(monkeypatch):
+    lzo = COMPRESSIONS['lzo']
+    decoded = []
+
+    def backend(name: str, delay: float, status: int = 0) -> dumpifs_core.BlockBackend:
+        def load():
+            def decode_block(src, in_len, dst):
+                decoded.append(name)
+                time.sleep(delay)
+                ctypes.memmove(dst, src, in_len)
+                return status, in_len
+
+            return decode_block
+
+        return dumpifs_core.BlockBackend(name, lzo, load)
+
+    backends = [backend('slow', 0.002), backend('fast', 0)]
+    monkeypatch.setattr(dumpifs_core, 'BLOCK_BACKENDS', backends)
+    samples = [b'block'] * 4
+    dumpifs_core.select_block_decoder(lzo, samples)
+    key = f'{os.uname().nodename}:lzo'
+    entry = json.loads(dumpifs_core.decoder_tuning_path().read_text())[key]
+    assert entry['backend'] == 'fast' and entry['candidates'] == ['slow', 'fast']
+    # the choice of this host is cached, the backends are not timed again
+    decoded.clear()
+    dumpifs_core.select_block_decoder(lzo, samples)
+    assert decoded == []
+    # another set of backends is timed again, leaving out the one failing on the samples
+    backends.append(backend('broken', 0, status=-1))
+    dumpifs_core.select_block_decoder(lzo, samples)
+    entry = json.loads(dumpifs_core.decoder_tuning_path().read_text())[key]
+    assert entry['backend'] == 'fast' and entry['candidates'] == ['slow', 'fast', 'broken']
+    assert sorted(entry['seconds']) == ['fast', 'slow']
+
+
+def test_nrv2b_round_trip():
+    data = b''.join(entry.data for entry in sample_entries())[:BLOCK_SIZE]
+    dst = bytearray(0x10000)
+    assert nrv2b.decompress_into(nrv2b_encode(data), dst) == (nrv2b.UCL_E_OK, len(data))
+    assert dst[:len(data)] == data
+
+
+@pytest.mark.parametrize('cut', [1, 100, -1])
+def test_nrv2b_truncated(cut):
+    block = nrv2b_encode(bytes(range(256)) * 16)
+    status, _ = nrv2b.decompress_into(block[:cut], bytearray(0x10000))
+    assert status in (nrv2b.UCL_E_INPUT_OVERRUN, nrv2b.UCL_E_LOOKBEHIND_OVERRUN)
+
+
+def test_nrv2b_output_overrun():
+    status, _ = nrv2b.decompress_into(nrv2b_encode(bytes(4096)), bytearray(100))
+    assert status == nrv2b.UCL_E_OUTPUT_OVERRUN
+
+
+def test_startup_budget(monkeypatch, caplog):
+    monkeypatch.setenv('DUMPIFS_STARTUP_BUDGET_MS', '0')
+    assert dumpifs_core.check_startup_budget() == errno.ETIME
+    monkeypatch.setenv('DUMPIFS_STARTUP_BUDGET_MS', 'fast')
+    monkeypatch.setattr(dumpifs_core, 'STARTUP_BUDGET_MS', 1e9)
+    assert dumpifs_core.check_startup_budget() == 0
+    assert "'fast' is not a number" in caplog.text
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/stat'), reason='no /proc')
+def test_startup_measured_from_process_start():
+    # the interpreter started and pytest ran long before dumpifs_core was imported
+    assert dumpifs_core.startup_elapsed_ms() > (time.perf_counter() - dumpifs_core.IMPORT_START) * 1000
+
+
+def test_script_launcher(tmp_path):
+    script = Path(dumpifs_core.__file__).with_name('dumpifs.py')
+    res = subprocess.run([sys.executable, str(script), str(tmp_path / 'missing.ifs')], capture_output=True,
+                         env={**os.environ, 'DUMPIFS_STARTUP_BUDGET_MS': '0'})
+    assert res.returncode == errno.ETIME
+    import dumpifs
+    assert dumpifs.IFSImage is dumpifs_core.IFSImage
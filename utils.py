@@ -1,7 +1,12 @@
 import logging
-import subprocess
+import os
 from pathlib import Path
 import shutil
+import stat
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import subprocess
 
 logger = logging.getLogger(__name__)
 class RunCmdFailed(Exception):
@@ -10,7 +15,7 @@ class RunCmdFailed(Exception):
         self.stderr = stderr
 
 def run_v1(cmd: str, shell: bool = True, check_result: bool = False, suppress_warning=False,
-           cwd=None) -> subprocess.CompletedProcess:
+           cwd=None) -> 'subprocess.CompletedProcess':
     """
     it is suitable to stdout length less than 4kb
     :param cmd:
@@ -20,6 +25,7 @@ def run_v1(cmd: str, shell: bool = True, check_result: bool = False, suppress_wa
     :param cwd: Sets the current directory before the child is executed.
     :return:
     """
+    import subprocess
     from shlex import split, quote
     resp = subprocess.run(cmd if shell else [quote(_) for _ in split(cmd)], shell=shell, capture_output=True,
                           encoding='utf8', errors='backslashreplace', cwd=cwd)
@@ -36,3 +42,27 @@ def shutil_rm(path: Path, ignore_errors=True):
         path.unlink(missing_ok=ignore_errors)
     elif path.is_dir():
         shutil.rmtree(path, ignore_errors=ignore_errors)
+
+
+def rmtree_writable(path: Path):
+    """
+    shutil.rmtree() of a tree extracted with the modes of an image: a directory of the tree its owner may not read,
+    search or write gets u+rwx and the removal is retried. A missing `path` is not an error.
+    """
+    root = os.path.abspath(path)
+
+    def retry(func, failed: str, exc_info):
+        ex = exc_info[1]
+        if isinstance(ex, FileNotFoundError):
+            return
+        # removing an entry needs its parent directory, listing a directory the directory itself
+        target = os.path.dirname(failed) if func in (os.unlink, os.rmdir) else failed
+        if not isinstance(ex, PermissionError) or os.path.commonpath([root, target]) != root:
+            raise ex
+        os.chmod(target, stat.S_IMODE(os.lstat(target).st_mode) | stat.S_IRWXU)
+        if func in (os.unlink, os.rmdir):
+            func(failed)
+        else:
+            shutil.rmtree(failed, onerror=retry)
+
+    shutil.rmtree(root, onerror=retry)